@@ -0,0 +1,175 @@
+"""
+Локальные заменители Object Storage и Message Queue для нагрузочных прогонов.
+
+Реализуют только те вызовы boto3, которыми пользуются функции, и считают
+каждый вызов, чтобы прогон мог сообщить число внешних обращений по этапам.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+
+class NoSuchKey(ClientError):
+    pass
+
+
+def client_error(code, status, operation, cls=ClientError):
+    return cls({"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+
+class StreamingBody:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+class CallCounter:
+    """Счетчик вызовов с имитацией сетевой задержки."""
+
+    def __init__(self, service, latency):
+        self.service = service
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def call(self, operation):
+        with self.lock:
+            self.calls[f"{self.service}.{operation}"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.calls)
+
+
+class FakeS3(CallCounter):
+    """Бакеты в памяти процесса с семантикой S3: ETag, LastModified, постраничный листинг."""
+
+    def __init__(self, latency=0.0):
+        super().__init__("s3", latency)
+        self.buckets = {}
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey, ClientError=ClientError)
+
+    def bucket(self, name):
+        with self.lock:
+            return self.buckets.setdefault(name, {})
+
+    def put_object(self, Bucket, Key, Body=b"", ContentType=None, IfNoneMatch=None, IfMatch=None, **kwargs):
+        self.call("PutObject")
+        data = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        bucket = self.bucket(Bucket)
+        # Проверка условия и запись под одной блокировкой, как атомарная условная запись S3
+        with self.lock:
+            current = bucket.get(Key)
+            if IfNoneMatch == "*" and current is not None:
+                raise client_error("PreconditionFailed", 412, "PutObject")
+            if IfMatch and (current is None or current["etag"] != IfMatch):
+                raise client_error("PreconditionFailed", 412, "PutObject")
+            bucket[Key] = {"data": data, "etag": etag, "modified": datetime.now(timezone.utc)}
+        return {"ETag": etag}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        self.call("GetObject")
+        obj = self.bucket(Bucket).get(Key)
+        if obj is None:
+            raise client_error("NoSuchKey", 404, "GetObject", NoSuchKey)
+        if IfNoneMatch and IfNoneMatch == obj["etag"]:
+            raise client_error("304", 304, "GetObject")
+        return {
+            "Body": StreamingBody(obj["data"]),
+            "ETag": obj["etag"],
+            "LastModified": obj["modified"],
+            "ContentLength": len(obj["data"]),
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.call("HeadObject")
+        obj = self.bucket(Bucket).get(Key)
+        if obj is None:
+            raise client_error("404", 404, "HeadObject")
+        return {"ETag": obj["etag"], "LastModified": obj["modified"], "ContentLength": len(obj["data"])}
+
+    def delete_object(self, Bucket, Key, IfMatch=None, **kwargs):
+        self.call("DeleteObject")
+        bucket = self.bucket(Bucket)
+        with self.lock:
+            current = bucket.get(Key)
+            if IfMatch and current is not None and current["etag"] != IfMatch:
+                raise client_error("PreconditionFailed", 412, "DeleteObject")
+            bucket.pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self.call("DeleteObjects")
+        bucket = self.bucket(Bucket)
+        for obj in Delete["Objects"]:
+            bucket.pop(obj["Key"], None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, StartAfter=None, **kwargs):
+        self.call("ListObjectsV2")
+        keys = sorted(key for key in list(self.bucket(Bucket)) if key.startswith(Prefix))
+        # Продолжение листинга важнее StartAfter, как в S3
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = [key for key in keys if key > after]
+        page = keys[:MaxKeys]
+        bucket = self.bucket(Bucket)
+        response = {"KeyCount": len(page), "IsTruncated": len(keys) > MaxKeys}
+        contents = []
+        for key in page:
+            obj = bucket.get(key)
+            if obj is not None:
+                contents.append({"Key": key, "ETag": obj["etag"], "LastModified": obj["modified"], "Size": len(obj["data"])})
+        if contents:
+            response["Contents"] = contents
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        return SimpleNamespace(paginate=self.paginate)
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        if PaginationConfig and "PageSize" in PaginationConfig:
+            kwargs["MaxKeys"] = PaginationConfig["PageSize"]
+        token = None
+        while True:
+            response = self.list_objects_v2(ContinuationToken=token, **kwargs)
+            yield response
+            if not response["IsTruncated"]:
+                return
+            token = response["NextContinuationToken"]
+
+
+class FakeSQS(CallCounter):
+    """Очередь в памяти процесса: отправленные сообщения забирает прогон crop_face."""
+
+    def __init__(self, latency=0.0):
+        super().__init__("sqs", latency)
+        self.messages = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.call("SendMessageBatch")
+        with self.lock:
+            self.messages.extend(entry["MessageBody"] for entry in Entries)
+        return {"Successful": [{"Id": entry["Id"], "MessageId": uuid4().hex} for entry in Entries]}
+
+    def drain(self):
+        with self.lock:
+            messages, self.messages = self.messages, []
+        return messages
@@ -0,0 +1,207 @@
+"""
+Локальные HTTP-заменители Telegram Bot API, Vision OCR и YandexGPT.
+
+Все три сервиса обслуживает один многопоточный сервер: маршрут определяется
+по пути запроса. Задержка каждого сервиса настраивается отдельно, а каждый
+запрос учитывается в счетчике вызовов.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+QUESTIONS = [
+    "Что такое процесс и чем он отличается от потока?",
+    "Опишите механизм виртуальной памяти и страничной адресации.",
+    "Какие алгоритмы планирования процессов вы знаете?",
+    "Что такое взаимоблокировка и как ее избежать?",
+    "Как устроена файловая система ext4?",
+    "Что такое системный вызов и как он выполняется?",
+]
+
+ANSWER_PARAGRAPH = (
+    "Операционная система управляет ресурсами компьютера и предоставляет "
+    "программам единый интерфейс доступа к ним. "
+)
+
+
+class FakeServices:
+    def __init__(self, latency=None, answer_chars=1500, stream_chunks=10):
+        self.latency = {"telegram": 0.0, "ocr": 0.0, "gpt": 0.0}
+        self.latency.update(latency or {})
+        self.answer_chars = answer_chars
+        self.stream_chunks = stream_chunks
+        self.calls = Counter()
+        self.files = {}
+        self.lock = threading.Lock()
+        self.message_id = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    def register_file(self, file_id, data):
+        self.files[file_id] = data
+
+    def next_message_id(self):
+        with self.lock:
+            self.message_id += 1
+            return self.message_id
+
+    def handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                # /file/bot{token}/photos/{file_id}.jpg
+                if self.path.startswith("/file/bot"):
+                    services.count("telegram.downloadFile")
+                    time.sleep(services.latency["telegram"])
+                    file_id = self.path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+                    data = services.files.get(file_id)
+                    if data is None:
+                        return self.send_json({"ok": False}, 404)
+                    return self.send_bytes(data, "image/jpeg")
+                self.send_json({"ok": False}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if self.path.startswith("/bot"):
+                    method = self.path.rsplit("/", 1)[-1]
+                    services.count(f"telegram.{method}")
+                    time.sleep(services.latency["telegram"])
+                    return self.send_json(services.telegram(method, self.parse_params(body)))
+                if self.path.endswith("/recognizeText"):
+                    services.count("ocr.recognizeText")
+                    time.sleep(services.latency["ocr"])
+                    return self.send_json(services.ocr(json.loads(body)))
+                if self.path.endswith("/completion"):
+                    services.count("gpt.completion")
+                    payload = json.loads(body)
+                    if payload.get("completionOptions", {}).get("stream"):
+                        return self.send_stream(services.stream_completion(payload))
+                    time.sleep(services.latency["gpt"])
+                    return self.send_json(services.completion(payload))
+                self.send_json({"ok": False}, 404)
+
+            def parse_params(self, body):
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    return json.loads(body or b"{}")
+                # python-telegram-bot передает сложные значения как JSON внутри формы
+                params = {}
+                for name, values in parse_qs(body.decode("utf-8")).items():
+                    value = values[0]
+                    try:
+                        params[name] = json.loads(value) if value[:1] in "[{" else value
+                    except ValueError:
+                        params[name] = value
+                return params
+
+            def send_bytes(self, data, content_type, status=200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_json(self, payload, status=200):
+                self.send_bytes(json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json", status)
+
+            def send_stream(self, lines):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for line in lines:
+                    data = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def message(self, chat_id, **fields):
+        return {
+            "message_id": self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            **fields,
+        }
+
+    def sent_photo(self, photo):
+        # Новый file_id выдается только при отправке по ссылке
+        file_id = photo if not str(photo).startswith("http") else f"tg-{hashlib.sha1(photo.encode()).hexdigest()[:16]}"
+        return [{"file_id": file_id, "file_unique_id": file_id[-8:], "width": 512, "height": 512}]
+
+    def telegram(self, method, params):
+        chat_id = params.get("chat_id", 0)
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method == "getFile":
+            file_id = params["file_id"]
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id[-8:],
+                "file_size": len(self.files.get(file_id, b"")),
+                "file_path": f"photos/{file_id}.jpg",
+            }
+        elif method in ("sendMessage", "editMessageText"):
+            result = self.message(chat_id, text=params.get("text", ""))
+        elif method == "sendPhoto":
+            result = self.message(chat_id, photo=self.sent_photo(params["photo"]))
+        elif method == "sendMediaGroup":
+            result = [self.message(chat_id, photo=self.sent_photo(item["media"])) for item in params["media"]]
+        else:
+            result = True
+        return {"ok": True, "result": result}
+
+    def ocr(self, payload):
+        digest = hashlib.sha1(payload["content"][:4096].encode()).digest()
+        text = QUESTIONS[digest[0] % len(QUESTIONS)]
+        return {"result": {"textAnnotation": {"fullText": text}}}
+
+    def answer(self, payload):
+        question = payload["messages"][-1]["text"]
+        text = f"{question}\n\n"
+        while len(text) < self.answer_chars:
+            text += ANSWER_PARAGRAPH
+        return text[:self.answer_chars]
+
+    def completion(self, payload):
+        return {"result": {"alternatives": [{"message": {"role": "assistant", "text": self.answer(payload)}}]}}
+
+    def stream_completion(self, payload):
+        text = self.answer(payload)
+        step = max(1, len(text) // self.stream_chunks)
+        for end in range(step, len(text) + step, step):
+            time.sleep(self.latency["gpt"] / self.stream_chunks)
+            yield {"result": {"alternatives": [{"message": {"role": "assistant", "text": text[:end]}}]}}
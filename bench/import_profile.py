@@ -0,0 +1,158 @@
+"""
+Отчет о времени холодного старта функций.
+
+Каждая функция загружается в отдельном свежем процессе под python -X importtime
+в режимах STARTUP_MODE=lazy и eager. Для каждой считается:
+  init_ms     - загрузка модуля функции (то, что платит каждый холодный старт);
+  deferred_ms - вызов preload() после загрузки, то есть импорты и клиенты,
+                которые в режиме lazy достаются первому запросу, которому они нужны;
+  imports     - самые тяжелые модули верхнего уровня по данным -X importtime
+                отдельно для загрузки и для preload().
+
+С --budget-file сравнивает init_ms с бюджетом и завершается с кодом 1 при
+превышении, чтобы время холодного старта можно было отслеживать в CI.
+
+Пример:
+    python bench/import_profile.py --budget-file bench/import_budget.json --output import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = {
+    "task1_bot": "task1/src/bot.py",
+    "detect_face": "task2/detect_face/index.py",
+    "crop_face": "task2/crop_face/index.py",
+    "task2_bot": "task2/bot/index.py",
+}
+INIT_MARKER = "-- import profile: init --"
+DEFERRED_MARKER = "-- import profile: deferred --"
+
+CHILD = """
+import importlib.util, json, sys, time
+path = sys.argv[1]
+sys.stderr.write({init!r} + "\\n")
+sys.stderr.flush()
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("function_under_test", path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+loaded = time.perf_counter()
+sys.stderr.write({deferred!r} + "\\n")
+sys.stderr.flush()
+module.preload()
+preloaded = time.perf_counter()
+print(json.dumps({{"init_ms": (loaded - started) * 1000, "deferred_ms": (preloaded - loaded) * 1000}}))
+""".format(init=INIT_MARKER, deferred=DEFERRED_MARKER)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Время импорта функций при холодном старте")
+    parser.add_argument("--functions", default=",".join(FUNCTIONS), help="функции через запятую")
+    parser.add_argument("--modes", default="lazy,eager", help="значения STARTUP_MODE через запятую")
+    parser.add_argument("--repeat", type=int, default=3, help="запусков на функцию и режим, берется медиана")
+    parser.add_argument("--top", type=int, default=8, help="сколько самых тяжелых импортов показывать")
+    parser.add_argument("--budget-file", help="JSON вида {функция: {режим: init_ms}}")
+    parser.add_argument("--output", help="файл для отчета в JSON")
+    return parser.parse_args()
+
+
+def parse_importtime(lines):
+    """Возвращает кумулятивное время импорта (мс) модулей верхнего уровня."""
+    imports = {}
+    for line in lines:
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, package = line[len("import time:"):].split("|", 2)
+        # Вложенные импорты отмечены дополнительными пробелами перед именем
+        if package.startswith("  "):
+            continue
+        name = package.strip()
+        imports[name] = imports.get(name, 0) + int(cumulative) / 1000
+    return imports
+
+
+def profile_once(path, mode):
+    env = dict(os.environ, STARTUP_MODE=mode, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, os.path.join(ROOT, path)],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.join(ROOT, path)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось загрузить {path} в режиме {mode}:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    lines = result.stderr.splitlines()
+    init, deferred = lines.index(INIT_MARKER), lines.index(DEFERRED_MARKER)
+    timings["imports"] = parse_importtime(lines[init + 1:deferred])
+    timings["deferred_imports"] = parse_importtime(lines[deferred + 1:])
+    return timings
+
+
+def heaviest(runs, field, top):
+    imports = {}
+    for name in runs[0][field]:
+        imports[name] = round(statistics.median(run[field].get(name, 0) for run in runs), 1)
+    return dict(sorted(imports.items(), key=lambda item: -item[1])[:top])
+
+
+def profile(path, mode, repeat, top):
+    runs = [profile_once(path, mode) for _ in range(repeat)]
+    return {
+        "init_ms": round(statistics.median(run["init_ms"] for run in runs), 1),
+        "deferred_ms": round(statistics.median(run["deferred_ms"] for run in runs), 1),
+        "imports": heaviest(runs, "imports", top),
+        "deferred_imports": heaviest(runs, "deferred_imports", top),
+    }
+
+
+def check_budget(report, budget_file):
+    with open(budget_file, encoding="utf-8") as f:
+        budget = json.load(f)
+    failures = []
+    for function, modes in budget.items():
+        for mode, limit in modes.items():
+            measured = report.get(function, {}).get(mode)
+            if measured is not None and measured["init_ms"] > limit:
+                failures.append(f"{function} ({mode}): {measured['init_ms']} мс при бюджете {limit} мс")
+    return failures
+
+
+def main():
+    args = parse_args()
+    functions = [name for name in args.functions.split(",") if name]
+    modes = [mode for mode in args.modes.split(",") if mode]
+    unknown = set(functions) - set(FUNCTIONS)
+    if unknown:
+        sys.exit(f"Неизвестные функции: {', '.join(sorted(unknown))}")
+
+    report = {}
+    print(f"{'функция':12} {'режим':6} {'init мс':>9} {'deferred мс':>12}  самые тяжелые импорты при загрузке / в preload()")
+    for function in functions:
+        report[function] = {}
+        for mode in modes:
+            result = profile(FUNCTIONS[function], mode, args.repeat, args.top)
+            report[function][mode] = result
+            init = ", ".join(f"{name} {ms:.0f}" for name, ms in list(result["imports"].items())[:3])
+            deferred = ", ".join(f"{name} {ms:.0f}" for name, ms in list(result["deferred_imports"].items())[:3])
+            print(f"{function:12} {mode:6} {result['init_ms']:>9} {result['deferred_ms']:>12}  {init} / {deferred or '-'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "functions": report}, f, ensure_ascii=False, indent=2)
+        print(f"Отчет записан в {args.output}")
+
+    if args.budget_file:
+        failures = check_budget(report, args.budget_file)
+        for failure in failures:
+            print(f"Превышен бюджет холодного старта: {failure}")
+        if failures:
+            sys.exit(1)
+        print("Время холодного старта в пределах бюджета.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+"""
+Нагрузочный прогон всех обработчиков на локальных заменителях облачных сервисов.
+
+Запускает task1/src/bot.py:handler, detect_face.handler, crop_face.handler
+и обработчик бота task2 против хранилища и очереди в памяти и поддельных
+Telegram, OCR и YandexGPT, подавая синтетические обновления и события
+с заданной частотой. Для каждого этапа считает p50/p99 задержки, пропускную
+способность, пиковую память и число внешних вызовов, результат пишет в JSON.
+
+Пример:
+    python bench/run.py --requests 40 --rate 10 --gpt-latency 0.8 --output bench.json
+    python bench/run.py --output branch.json --compare bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import cv2
+import numpy as np
+
+from emulators import FakeS3, FakeSQS
+from fake_services import FakeServices
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES_DIR = os.path.join(ROOT, "bench", "samples")
+STAGES = ["task1_text", "task1_photo", "task1_album", "detect_face", "crop_face", "task2_bot"]
+
+TASK1_BUCKET = "bench-task1"
+IMAGES_BUCKET = "bench-images"
+FACES_BUCKET = "bench-faces"
+TOKEN = "123456:bench"
+BOT_NAMES = ["Анна", "Борис", "Вера", "Глеб"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон обработчиков на локальных заменителях")
+    parser.add_argument("--requests", type=int, default=20, help="число обновлений или событий на этап")
+    parser.add_argument("--rate", type=float, default=20.0, help="частота подачи, запросов в секунду")
+    parser.add_argument("--concurrency", type=int, default=4, help="одновременных вызовов синхронных обработчиков")
+    parser.add_argument("--stages", default=",".join(STAGES), help="этапы через запятую")
+    parser.add_argument("--s3-latency", type=float, default=0.01)
+    parser.add_argument("--sqs-latency", type=float, default=0.01)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--ocr-latency", type=float, default=0.3)
+    parser.add_argument("--gpt-latency", type=float, default=0.5)
+    parser.add_argument("--images-per-event", type=int, default=1, help="объектов в одном событии хранилища")
+    parser.add_argument("--crop-batch", type=int, default=10, help="сообщений очереди в одном вызове crop_face")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="доля повторно загружаемых изображений")
+    parser.add_argument("--unique-questions", type=float, default=0.5, help="доля текстовых вопросов без повторов")
+    parser.add_argument("--trace-memory", action="store_true", help="пиковая память Python по этапам через tracemalloc")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод обработчиков")
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    return parser.parse_args()
+
+
+def configure_environment(args, services):
+    """Задает переменные окружения до импорта функций: они читают их при загрузке модуля."""
+    env = {
+        # task1
+        "TG_BOT_KEY": TOKEN,
+        "YANDEX_API_KEY": "bench",
+        "YC_BUCKET_NAME": TASK1_BUCKET,
+        "YC_FOLDER_ID": "bench",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "OCR_URL": f"{services.base_url}/ocr/v1/recognizeText",
+        "GPT_URL": f"{services.base_url}/foundationModels/v1/completion",
+        "TELEGRAM_BASE_URL": services.base_url,
+        "MEDIA_GROUP_WAIT": "0.3",
+        # task2
+        "TG_BOT_TOKEN": TOKEN,
+        "URL_QUEUE": "bench-queue",
+        "IMAGES_BUCKET_NAME": IMAGES_BUCKET,
+        "PROCESSED_FACES_BUCKET_NAME": FACES_BUCKET,
+        "API_GATEWAY": "https://gateway.bench",
+        "API_GATEWAY_ORIGINAL": "https://gateway-original.bench",
+        "YANDEX_ACCESS_KEY": "bench",
+        "YANDEX_SECRET_KEY": "bench",
+        "YANDEX_STORAGE_ACCESS_KEY": "bench",
+        "YANDEX_STORAGE_SECRET_KEY": "bench",
+    }
+    # Явно заданные переменные (например, FUSED_MODE=1) имеют приоритет
+    for name, value in env.items():
+        os.environ.setdefault(name, value)
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_handlers(s3, sqs):
+    """Импортирует функции под разными именами (у всех task2-функций файл index.py) и подменяет клиенты."""
+    started = time.perf_counter()
+    bot = load_module("bench_task1_bot", "task1/src/bot.py")
+    detect = load_module("bench_detect_face", "task2/detect_face/index.py")
+    crop = load_module("bench_crop_face", "task2/crop_face/index.py")
+    task2_bot = load_module("bench_task2_bot", "task2/bot/index.py")
+    import_seconds = time.perf_counter() - started
+
+    bot._s3_client = s3
+    detect._s3_client = s3
+    detect._sqs_client = sqs
+    detect._crop_face_module = crop
+    crop._s3_client = s3
+    task2_bot._s3_client = s3
+    # Журнал task1 на уровне INFO заметно влияет на задержки и засоряет отчет
+    logging.getLogger().setLevel(logging.WARNING)
+    return {"task1": bot, "detect": detect, "crop": crop, "task2_bot": task2_bot}, import_seconds
+
+
+def encode(image):
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def build_samples():
+    """Изображения с известным числом лиц, собранные из одного исходника."""
+    with open(os.path.join(SAMPLES_DIR, "astronaut.jpg"), "rb") as f:
+        data = f.read()
+    face = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    gradient = np.tile(np.linspace(0, 255, 640, dtype=np.uint8), (480, 1))
+    return {
+        "single": {"data": data, "faces": 1},
+        "single_large": {"data": encode(cv2.resize(face, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)), "faces": 1},
+        "group_of_four": {"data": encode(np.vstack([np.hstack([face, face])] * 2)), "faces": 4},
+        "no_faces": {"data": encode(cv2.cvtColor(gradient, cv2.COLOR_GRAY2BGR)), "faces": 0},
+    }
+
+
+def unique_copy(data):
+    # Данные после маркера конца JPEG декодер игнорирует, а ETag меняется
+    return data + uuid4().bytes
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def diff_calls(before, after):
+    return {name: count - before.get(name, 0) for name, count in sorted(after.items()) if count != before.get(name, 0)}
+
+
+class Stage:
+    """Замер одного этапа: задержки вызовов, ошибки, память и внешние обращения."""
+
+    def __init__(self, name, counters, trace_memory):
+        self.name = name
+        self.counters = counters
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.before = self.calls()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.after = self.calls()
+
+    def calls(self):
+        calls = {}
+        for counter in self.counters:
+            calls.update(counter.snapshot())
+        return calls
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.latencies.append(latency)
+            self.errors += not ok
+
+    def report(self):
+        count = len(self.latencies)
+        calls = diff_calls(self.before, self.after)
+        report = {
+            "requests": count,
+            "errors": self.errors,
+            "elapsed_s": round(self.elapsed, 3),
+            "throughput_rps": round(count / self.elapsed, 2) if self.elapsed else None,
+            "latency_ms": {
+                "p50": ms(percentile(self.latencies, 50)),
+                "p99": ms(percentile(self.latencies, 99)),
+                "mean": ms(statistics.fmean(self.latencies)) if count else None,
+                "max": ms(max(self.latencies)) if count else None,
+            },
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "external_calls": calls,
+            "external_calls_per_request": {name: round(value / count, 2) for name, value in calls.items()} if count else {},
+        }
+        if self.trace_memory:
+            report["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        return report
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def ok_status(response):
+    return isinstance(response, dict) and response.get("statusCode", 200) < 400
+
+
+def replay_sync(stage, jobs, rate, concurrency):
+    """
+    Подает вызовы синхронного обработчика с частотой rate. jobs - список
+    последовательностей: вызовы одной последовательности идут строго по очереди
+    (например, команды одного чата), разные - параллельно.
+    """
+    started = time.perf_counter()
+    schedule = {}
+    position = 0
+    for step in range(max((len(job) for job in jobs), default=0)):
+        for i, job in enumerate(jobs):
+            if step < len(job):
+                schedule[(i, step)] = position / rate
+                position += 1
+
+    def run(i):
+        for step, call in enumerate(jobs[i]):
+            delay = started + schedule[(i, step)] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            call_started = time.perf_counter()
+            try:
+                ok = ok_status(call())
+            except Exception as e:
+                print(f"[{stage.name}] ошибка: {e}", file=sys.__stderr__)
+                ok = False
+            stage.record(time.perf_counter() - call_started, ok)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, range(len(jobs))))
+
+
+async def replay_async(stage, groups, rate):
+    """Подает обновления task1 с частотой rate; обновления одной группы (альбом) приходят одновременно."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def run(delay, call):
+        await asyncio.sleep(delay)
+        call_started = time.perf_counter()
+        try:
+            ok = ok_status(await call())
+        except Exception as e:
+            print(f"[{stage.name}] ошибка: {e}", file=sys.__stderr__)
+            ok = False
+        stage.record(time.perf_counter() - call_started, ok)
+
+    tasks = []
+    for i, group in enumerate(groups):
+        delay = started + i / rate - loop.time()
+        tasks.extend(asyncio.create_task(run(delay, call)) for call in group)
+    await asyncio.gather(*tasks)
+
+
+class Updates:
+    """Синтетические обновления Telegram."""
+
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def message(self, chat_id, **fields):
+        self.update_id += 1
+        self.message_id += 1
+        message = {
+            "message_id": self.message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            **fields,
+        }
+        return {"body": json.dumps({"update_id": self.update_id, "message": message}, ensure_ascii=False)}
+
+    def text(self, chat_id, text):
+        fields = {"text": text}
+        if text.startswith("/"):
+            command = text.split()[0]
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return self.message(chat_id, **fields)
+
+    def photo(self, chat_id, file_id, size, media_group_id=None):
+        width, height = size
+        photo = [{"file_id": file_id, "file_unique_id": f"u{file_id}", "width": width, "height": height, "file_size": 0}]
+        fields = {"photo": photo}
+        if media_group_id:
+            fields["media_group_id"] = media_group_id
+        return self.message(chat_id, **fields)
+
+
+def task1_text_groups(args, bot, updates):
+    from fake_services import QUESTIONS
+
+    groups = []
+    for i in range(args.requests):
+        question = QUESTIONS[i % len(QUESTIONS)]
+        if (i * 7919 % 100) < args.unique_questions * 100:
+            question = f"{question} Вариант {i}."
+        event = updates.text(1000 + i, question)
+        groups.append([lambda event=event: bot.handler(event, None)])
+    return groups
+
+
+def register_photos(services, samples, count):
+    """Регистрирует в поддельном Telegram count различных фотографий вопросов."""
+    file_ids = []
+    sources = list(samples.values())
+    for i in range(count):
+        file_id = f"photo{i}"
+        services.register_file(file_id, unique_copy(sources[i % len(sources)]["data"]))
+        file_ids.append(file_id)
+    return file_ids
+
+
+def task1_photo_groups(args, bot, updates, file_ids):
+    groups = []
+    for i in range(args.requests):
+        # Фотографии повторяются, как пересланные копии одного билета
+        event = updates.photo(2000 + i, file_ids[i % len(file_ids)], (1024, 768))
+        groups.append([lambda event=event: bot.handler(event, None)])
+    return groups
+
+
+def task1_album_groups(args, bot, updates, file_ids):
+    groups = []
+    for i in range(max(1, args.requests // 3)):
+        album = f"album{uuid4().hex[:8]}"
+        events = [
+            updates.photo(3000 + i, file_ids[(i * 3 + j) % len(file_ids)], (1024, 768), album)
+            for j in range(3)
+        ]
+        groups.append([lambda event=event: bot.handler(event, None) for event in events])
+    return groups
+
+
+def run_task1(args, stage_names, modules, services, samples, counters, results):
+    bot = modules["task1"]
+    s3 = counters[0]
+    s3.put_object(
+        Bucket=TASK1_BUCKET,
+        Key="instruction.txt",
+        Body="Отвечай на экзаменационные вопросы по операционным системам.".encode("utf-8"),
+    )
+    updates = Updates()
+    file_ids = register_photos(services, samples, max(4, args.requests // 2))
+    builders = {
+        "task1_text": lambda: task1_text_groups(args, bot, updates),
+        "task1_photo": lambda: task1_photo_groups(args, bot, updates, file_ids),
+        "task1_album": lambda: task1_album_groups(args, bot, updates, file_ids),
+    }
+
+    async def replay_all():
+        for name in stage_names:
+            with Stage(name, counters, args.trace_memory) as stage:
+                await replay_async(stage, builders[name](), args.rate)
+            results[name] = stage.report()
+        await bot.reset_application()
+        await bot.close_http_client()
+
+    asyncio.run(replay_all())
+
+
+def storage_event(keys):
+    return {
+        "messages": [
+            {
+                "event_metadata": {"event_type": "yandex.cloud.events.storage.ObjectCreate"},
+                "details": {"bucket_id": IMAGES_BUCKET, "object_id": key},
+            }
+            for key in keys
+        ]
+    }
+
+
+def upload_originals(args, s3, samples):
+    """Загружает оригиналы в бакет и возвращает ключи с ожидаемым числом лиц."""
+    uploads = []
+    names = list(samples)
+    previous = []
+    for i in range(args.requests * args.images_per_event):
+        if previous and (i * 7919 % 100) < args.repeat_ratio * 100:
+            # Повторная загрузка того же содержимого под другим ключом
+            name, data = previous[i % len(previous)]
+        else:
+            name = names[i % len(names)]
+            data = unique_copy(samples[name]["data"])
+            previous.append((name, data))
+        key = f"bench/{i:05d}_{name}.jpg"
+        s3.put_object(Bucket=IMAGES_BUCKET, Key=key, Body=data, ContentType="image/jpeg")
+        uploads.append((key, name))
+    return uploads
+
+
+def detection_accuracy(s3, detect, samples, uploads):
+    """Сравнивает сохраненные результаты детекции с известным числом лиц на образцах."""
+    accuracy = {name: {"expected": sample["faces"], "detected": [], "mismatches": 0} for name, sample in samples.items()}
+    for key, name in uploads:
+        etag = s3.head_object(Bucket=IMAGES_BUCKET, Key=key)["ETag"].strip('"')
+        obj = s3.bucket(FACES_BUCKET).get(f"{detect.DETECTIONS_PREFIX}{etag}.json")
+        detected = len(json.loads(obj["data"])["faces"]) if obj else None
+        accuracy[name]["detected"].append(detected)
+        accuracy[name]["mismatches"] += detected != samples[name]["faces"]
+    for entry in accuracy.values():
+        entry["detected"] = sorted(set(entry["detected"]), key=lambda value: -1 if value is None else value)
+    return accuracy
+
+
+def run_task2(args, stage_names, modules, samples, counters, sqs, results):
+    s3 = counters[0]
+    detect, crop, task2_bot = modules["detect"], modules["crop"], modules["task2_bot"]
+
+    if "detect_face" in stage_names:
+        uploads = upload_originals(args, s3, samples)
+        step = args.images_per_event
+        jobs = [
+            [lambda keys=[key for key, _ in uploads[i:i + step]]: detect.handler(storage_event(keys), None)]
+            for i in range(0, len(uploads), step)
+        ]
+        with Stage("detect_face", counters, args.trace_memory) as stage:
+            replay_sync(stage, jobs, args.rate, args.concurrency)
+        results["detect_face"] = stage.report()
+        results["detect_face"]["faces_queued"] = len(sqs.messages)
+        results["detect_face"]["fused_mode"] = detect.FUSED_MODE
+        results["detect_face"]["accuracy"] = detection_accuracy(s3, detect, samples, uploads)
+
+    if "crop_face" in stage_names:
+        messages = sqs.drain()
+        batch = args.crop_batch
+        jobs = [
+            [lambda bodies=messages[i:i + batch]: crop.handler(
+                {"messages": [{"details": {"message": {"body": body}}} for body in bodies]}, None
+            )]
+            for i in range(0, len(messages), batch)
+        ]
+        with Stage("crop_face", counters, args.trace_memory) as stage:
+            replay_sync(stage, jobs, args.rate, args.concurrency)
+        results["crop_face"] = stage.report()
+        results["crop_face"]["messages"] = len(messages)
+        results["crop_face"]["unnamed_faces"] = sum(
+            key.startswith(crop.UNNAMED_INDEX_PREFIX) for key in list(s3.bucket(FACES_BUCKET))
+        )
+
+    if "task2_bot" in stage_names:
+        updates = Updates()
+        # Сценарий пользователя: взять лицо, назвать его, найти фотографии и листать дальше
+        jobs = []
+        for i in range(max(1, args.requests // 4)):
+            chat_id = 5000 + i
+            name = BOT_NAMES[i % len(BOT_NAMES)]
+            script = [
+                updates.text(chat_id, "/getface"),
+                updates.text(chat_id, name),
+                updates.text(chat_id, f"/find {name}"),
+                updates.text(chat_id, "/more"),
+            ]
+            jobs.append([lambda event=event: task2_bot.handler(event, None) for event in script])
+        with Stage("task2_bot", counters, args.trace_memory) as stage:
+            replay_sync(stage, jobs, args.rate, args.concurrency)
+        results["task2_bot"] = stage.report()
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        branch = subprocess.run(["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "branch": branch, "dirty": dirty}
+    except OSError:
+        return {}
+
+
+def compare(results, baseline_path):
+    """Печатает изменение задержек и пропускной способности относительно прошлого прогона."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} ({baseline['meta'].get('git', {}).get('commit', '?')[:10]}):")
+    for name, stage in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if not old:
+            continue
+        cells = []
+        for label, path in (("p50", ("latency_ms", "p50")), ("p99", ("latency_ms", "p99")), ("rps", ("throughput_rps",))):
+            new_value, old_value = stage, old
+            for part in path:
+                new_value, old_value = new_value[part], old_value[part]
+            if new_value is None or not old_value:
+                continue
+            cells.append(f"{label} {old_value} -> {new_value} ({(new_value - old_value) / old_value:+.0%})")
+        calls_new = sum(stage["external_calls"].values())
+        calls_old = sum(old["external_calls"].values())
+        cells.append(f"вызовов {calls_old} -> {calls_new}")
+        print(f"  {name:12} " + ", ".join(cells))
+
+
+def print_summary(results):
+    print(f"\nИмпорт модулей: {results['meta']['import_s']} с")
+    print(f"{'этап':12} {'запросов':>8} {'ошибок':>6} {'p50 мс':>8} {'p99 мс':>8} {'rps':>7} {'RSS МБ':>7}  внешние вызовы")
+    for name, stage in results["stages"].items():
+        calls = ", ".join(f"{call}={count}" for call, count in stage["external_calls"].items())
+        print(
+            f"{name:12} {stage['requests']:>8} {stage['errors']:>6} {stage['latency_ms']['p50'] or 0:>8} "
+            f"{stage['latency_ms']['p99'] or 0:>8} {stage['throughput_rps'] or 0:>7} {stage['peak_rss_mb']:>7}  {calls}"
+        )
+    accuracy = results["stages"].get("detect_face", {}).get("accuracy")
+    if accuracy:
+        print("Точность детекции: " + ", ".join(
+            f"{name} ожидалось {entry['expected']}, найдено {entry['detected']}" for name, entry in accuracy.items()
+        ))
+
+
+def main():
+    args = parse_args()
+    stage_names = [name for name in args.stages.split(",") if name]
+    unknown = set(stage_names) - set(STAGES)
+    if unknown:
+        sys.exit(f"Неизвестные этапы: {', '.join(sorted(unknown))}")
+
+    services = FakeServices({"telegram": args.telegram_latency, "ocr": args.ocr_latency, "gpt": args.gpt_latency}).start()
+    s3 = FakeS3(args.s3_latency)
+    sqs = FakeSQS(args.sqs_latency)
+    counters = [s3, sqs, services]
+    configure_environment(args, services)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    results = {"stages": {}}
+    with output:
+        modules, import_seconds = load_handlers(s3, sqs)
+        samples = build_samples()
+        task1_stages = [name for name in stage_names if name.startswith("task1")]
+        if task1_stages:
+            run_task1(args, task1_stages, modules, services, samples, counters, results["stages"])
+        run_task2(args, stage_names, modules, samples, counters, sqs, results["stages"])
+    services.stop()
+
+    results["stages"] = {name: results["stages"][name] for name in stage_names if name in results["stages"]}
+    results["meta"] = {
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "import_s": round(import_seconds, 3),
+        "args": vars(args),
+        "env": {name: os.environ[name] for name in ("FUSED_MODE", "DETECTOR_BACKEND", "GPT_STREAMING", "APP_LIFECYCLE") if name in os.environ},
+        "samples": {name: sample["faces"] for name, sample in samples.items()},
+    }
+
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    # Пулы потоков функций не завершаются сами, а atexit task1 ждет закрытого цикла
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,266 @@
+"""
+Замеры этапов вызова функции и сводка в одну JSON-строку.
+
+Общий модуль для task1 и task2: Terraform кладет его в архив каждой функции
+как metrics.py. Обработчик оборачивается декоратором instrument_handler, внутри
+вызова участки кода замеряются через span(), а вызовы boto3 - автоматически
+после instrument_boto3(client). По завершении вызова в stdout печатается одна
+строка вида
+
+    {"level": "INFO", "msg": "invocation metrics", "function": "detect_face",
+     "invocation_id": "...", "duration_ms": 812.4, "stages": {"s3.GetObject":
+     {"count": 1, "ms": 35.1, "max_ms": 35.1, "bytes": 54321}, ...}, ...}
+
+которую Cloud Logging разбирает как структурированную запись.
+
+Доля замеряемых вызовов задается METRICS_SAMPLE_RATE (0 - выключено). Для
+незамеряемого вызова span() возвращает общую заглушку, и затраты сводятся
+к чтению contextvar.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import resource
+import threading
+import time
+from uuid import uuid4
+
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1"))
+
+_current = contextvars.ContextVar("metrics_invocation", default=None)
+_started_functions = set()
+
+
+class Invocation:
+    """Накопитель замеров одного вызова. Пишут в него и потоки пулов, поэтому под блокировкой."""
+
+    def __init__(self, function, request_id):
+        self.function = function
+        self.invocation_id = request_id or uuid4().hex[:16]
+        self.cold_start = function not in _started_functions
+        _started_functions.add(function)
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, bytes_=0, items=0, error=False):
+        ms = seconds * 1000
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"count": 0, "ms": 0.0, "max_ms": 0.0, "bytes": 0, "items": 0, "errors": 0}
+            stage["count"] += 1
+            stage["ms"] += ms
+            stage["max_ms"] = max(stage["max_ms"], ms)
+            stage["bytes"] += bytes_
+            stage["items"] += items
+            stage["errors"] += error
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self, status):
+        with self.lock:
+            stages = {
+                name: {key: round(value, 1) if isinstance(value, float) else value for key, value in stage.items() if value}
+                for name, stage in self.stages.items()
+            }
+            counters = dict(self.counters)
+        return {
+            "level": "INFO",
+            "msg": "invocation metrics",
+            "function": self.function,
+            "invocation_id": self.invocation_id,
+            "cold_start": self.cold_start,
+            "status": status,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "stages": stages,
+            "counters": counters,
+        }
+
+
+class Span:
+    """Замер участка кода; байты и элементы можно добавить, пока участок открыт."""
+
+    __slots__ = ("invocation", "name", "bytes", "items", "started")
+
+    def __init__(self, invocation, name, bytes_=0, items=0):
+        self.invocation = invocation
+        self.name = name
+        self.bytes = bytes_
+        self.items = items
+
+    def add(self, bytes_=0, items=0):
+        self.bytes += bytes_
+        self.items += items
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.invocation.record(self.name, time.perf_counter() - self.started, self.bytes, self.items, exc_type is not None)
+        return False
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def add(self, bytes_=0, items=0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name, bytes_=0, items=0):
+    """Возвращает контекстный менеджер замера этапа name в текущем вызове."""
+    invocation = _current.get()
+    if invocation is None:
+        return NOOP_SPAN
+    return Span(invocation, name, bytes_, items)
+
+
+def record(name, seconds, bytes_=0, items=0, error=False):
+    """Добавляет уже измеренную длительность этапа name к текущему вызову."""
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.record(name, seconds, bytes_, items, error)
+
+
+def count(name, value=1):
+    """Добавляет value к счетчику name текущего вызова."""
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.count(name, value)
+
+
+def bind(fn):
+    """
+    Привязывает fn к текущему вызову для запуска в пуле потоков: потоки пула
+    не наследуют contextvars, и без привязки их замеры потерялись бы.
+    """
+    if _current.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # Один контекст нельзя войти из двух потоков сразу, поэтому каждому запуску - своя копия
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def start(function, context=None):
+    """Начинает замер вызова, если он попал в выборку. Возвращает токен для finish()."""
+    if METRICS_SAMPLE_RATE <= 0 or (METRICS_SAMPLE_RATE < 1 and random.random() >= METRICS_SAMPLE_RATE):
+        return None
+    invocation = Invocation(function, getattr(context, "request_id", None))
+    return _current.set(invocation)
+
+
+def finish(token, status):
+    """Печатает сводку вызова и сбрасывает текущий вызов."""
+    if token is None:
+        return
+    invocation = _current.get()
+    _current.reset(token)
+    print(json.dumps(invocation.summary(status), ensure_ascii=False), flush=True)
+
+
+def response_status(response):
+    if isinstance(response, dict):
+        return response.get("statusCode", 200)
+    return 200
+
+
+def instrument_handler(function):
+    """Декоратор обработчика функции: синхронного или async."""
+
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(event, context):
+                token = start(function, context)
+                status = "error"
+                try:
+                    response = await handler(event, context)
+                    status = response_status(response)
+                    return response
+                finally:
+                    finish(token, status)
+
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            token = start(function, context)
+            status = "error"
+            try:
+                response = handler(event, context)
+                status = response_status(response)
+                return response
+            finally:
+                finish(token, status)
+
+        return wrapper
+
+    return decorator
+
+
+def _body_size(body):
+    if isinstance(body, (bytes, str)):
+        return len(body)
+    # Тело PutObject botocore к этому моменту уже обернул в BytesIO
+    if hasattr(body, "getbuffer"):
+        return body.getbuffer().nbytes
+    return 0
+
+
+def _before_boto3_call(model, params, context, **kwargs):
+    invocation = _current.get()
+    if invocation is None:
+        return
+    name = f"{model.service_model.endpoint_prefix}.{model.name}"
+    context["metrics"] = (invocation, name, time.perf_counter(), _body_size(params.get("body")))
+
+
+def _after_boto3_call(http_response, parsed, context, **kwargs):
+    measure = context.pop("metrics", None)
+    if measure is None:
+        return
+    invocation, name, started, sent = measure
+    # HeadObject тоже возвращает ContentLength, но тело не передает
+    received = parsed.get("ContentLength") or 0 if name.endswith(".GetObject") else 0
+    items = parsed.get("Contents") or parsed.get("Successful") or parsed.get("Deleted") or ()
+    invocation.record(name, time.perf_counter() - started, sent + received, len(items), http_response.status_code >= 400)
+
+
+def _boto3_call_error(context, **kwargs):
+    measure = context.pop("metrics", None)
+    if measure is None:
+        return
+    invocation, name, started, sent = measure
+    invocation.record(name, time.perf_counter() - started, sent, 0, True)
+
+
+def instrument_boto3(client):
+    """Замеряет каждый вызов API клиента boto3 как этап {сервис}.{операция}."""
+    # Первым, чтобы засечь время раньше обработчиков, которые могут сами вернуть ответ
+    client.meta.events.register_first("before-call", _before_boto3_call)
+    client.meta.events.register("after-call", _after_boto3_call)
+    client.meta.events.register("after-call-error", _boto3_call_error)
+    return client
@@ -20,6 +20,37 @@ resource "yandex_iam_service_account_static_access_key" "service_account_key" {
 resource "yandex_storage_bucket" "tg_bucket" {
   bucket    = var.bucket_name
   folder_id = var.folder_id
+
+  lifecycle_rule {
+    id      = "media-groups"
+    enabled = true
+    prefix  = "media_groups/"
+
+    expiration {
+      days = 1
+    }
+  }
+
+  # Устаревшие записи кэшей (в том числе от прежней инструкции) удаляет хранилище, а не бот
+  lifecycle_rule {
+    id      = "answer-cache"
+    enabled = true
+    prefix  = "cache/answers/"
+
+    expiration {
+      days = local.answer_cache_days
+    }
+  }
+
+  lifecycle_rule {
+    id      = "ocr-cache"
+    enabled = true
+    prefix  = "cache/ocr/"
+
+    expiration {
+      days = local.ocr_cache_days
+    }
+  }
 }
 
 resource "yandex_storage_object" "yandex_gpt" {
@@ -28,13 +59,21 @@ resource "yandex_storage_object" "yandex_gpt" {
   source = "instruction.txt"
 }
 
+locals {
+  # Бот ограничивает повторы запросов к OCR и YandexGPT этим же временем
+  execution_timeout = 20
+  # Срок жизни записей кэшей в бакете; бот не отдает записи старше этого срока
+  answer_cache_days = 7
+  ocr_cache_days    = 30
+}
+
 resource "yandex_function" "bot-func" {
   name               = "bot-func"
   user_hash          = archive_file.zip.output_sha256
   runtime            = "python312"
   entrypoint         = "bot.handler"
   memory             = 128
-  execution_timeout  = 20
+  execution_timeout  = local.execution_timeout
   service_account_id = var.service_account_id
 
   environment = {
@@ -44,6 +83,10 @@ resource "yandex_function" "bot-func" {
     AWS_ACCESS_KEY_ID     = yandex_iam_service_account_static_access_key.service_account_key.access_key
     AWS_SECRET_ACCESS_KEY = yandex_iam_service_account_static_access_key.service_account_key.secret_key
     YANDEX_API_KEY        = var.yandex_api_key
+    METRICS_SAMPLE_RATE   = var.metrics_sample_rate
+    FUNCTION_TIMEOUT      = local.execution_timeout
+    ANSWER_CACHE_TTL      = local.answer_cache_days * 86400
+    OCR_CACHE_TTL         = local.ocr_cache_days * 86400
   }
 
   mounts {
@@ -62,7 +105,22 @@ resource "yandex_function" "bot-func" {
 resource "archive_file" "zip" {
   type        = "zip"
   output_path = "src.zip"
-  source_dir  = "src"
+
+  source {
+    content  = file("src/bot.py")
+    filename = "bot.py"
+  }
+
+  source {
+    content  = file("src/requirements.txt")
+    filename = "requirements.txt"
+  }
+
+  # Общий модуль замеров task1 и task2
+  source {
+    content  = file("../common/metrics.py")
+    filename = "metrics.py"
+  }
 }
 
 output "func_url" {
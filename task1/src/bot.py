@@ -1,15 +1,35 @@
-import boto3
-import requests
-from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
+from __future__ import annotations
+
 import base64
+import hashlib
 import json
 import logging
 import os
+import random
+import re
+import signal
+import sys
+import threading
+import unicodedata
 import asyncio
+import atexit
+import contextvars
 import io
+import time
+from collections import OrderedDict
 from logging.config import dictConfig
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
+try:
+    import metrics
+except ImportError:
+    # Локальный запуск из репозитория: общий модуль лежит в каталоге common
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+    import metrics
 
 dictConfig({
     "version": 1,
@@ -37,47 +57,692 @@ YC_STORAGE_BUCKET = os.getenv("YC_BUCKET_NAME")
 YC_PROJECT_FOLDER = os.getenv("YC_FOLDER_ID")
 AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+# warm - приложение живет между вызовами, per_request - создается на каждый вызов
+APP_LIFECYCLE = os.getenv("APP_LIFECYCLE", "warm")
+# lazy - telegram, boto3, httpx и Pillow импортируются при первом использовании,
+# eager - вместе с функцией, чтобы первый запрос не платил за импорт
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+
+INSTRUCTION_KEY = "instruction.txt"
+INSTRUCTION_CACHE_TTL = float(os.getenv("INSTRUCTION_CACHE_TTL", "300"))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_instruction_cache = {"text": None, "etag": None, "checked_at": 0.0}
+_instruction_stats = {"hit": 0, "miss": 0, "revalidated": 0, "stale": 0}
+
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        # Клиент запрашивают из потоков asyncio.to_thread, создается он один раз
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                session = boto3.session.Session(
+                    aws_access_key_id=AWS_ACCESS_KEY,
+                    aws_secret_access_key=AWS_SECRET_KEY
+                )
+                _s3_client = metrics.instrument_boto3(session.client("s3", endpoint_url="https://storage.yandexcloud.net"))
+    return _s3_client
+
+
+def is_not_modified(error):
+    return error.response.get("Error", {}).get("Code") in ("304", "NotModified")
+
 
 def fetch_instruction_from_storage():
+    cache = _instruction_cache
+    now = time.monotonic()
+    if cache["text"] is not None and now - cache["checked_at"] < INSTRUCTION_CACHE_TTL:
+        _instruction_stats["hit"] += 1
+        return cache["text"]
+
     try:
-        session = boto3.session.Session(
-            aws_access_key_id=AWS_ACCESS_KEY,
-            aws_secret_access_key=AWS_SECRET_KEY
-        )
-        s3 = session.client("s3", endpoint_url="https://storage.yandexcloud.net")
-        response = s3.get_object(Bucket=YC_STORAGE_BUCKET, Key="instruction.txt")
-        return response['Body'].read().decode('utf-8')
+        s3 = get_s3_client()
+        from botocore.exceptions import ClientError
+        params = {"Bucket": YC_STORAGE_BUCKET, "Key": INSTRUCTION_KEY}
+        if cache["etag"]:
+            params["IfNoneMatch"] = cache["etag"]
+        try:
+            response = s3.get_object(**params)
+        except ClientError as e:
+            if not (cache["text"] is not None and is_not_modified(e)):
+                raise
+            cache["checked_at"] = now
+            _instruction_stats["revalidated"] += 1
+            return cache["text"]
+
+        cache["text"] = response['Body'].read().decode('utf-8')
+        cache["etag"] = response.get("ETag")
+        cache["checked_at"] = now
+        _instruction_stats["miss"] += 1
+        return cache["text"]
     except Exception as e:
         logger.error(f"Ошибка загрузки инструкции: {e}")
+        if cache["text"] is None:
+            return None
+        # Хранилище временно недоступно - отдаем последнюю полученную версию
+        _instruction_stats["stale"] += 1
+        return cache["text"]
+    finally:
+        logger.info(f"Кэш инструкции: {_instruction_stats}")
+
+
+OCR_URL = os.getenv("OCR_URL", "https://ocr.api.cloud.yandex.net/ocr/v1/recognizeText")
+GPT_URL = os.getenv("GPT_URL", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
+# Адрес Bot API; переопределяется для локальных стендов и нагрузочных прогонов
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org")
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "8"))
+GPT_TIMEOUT = float(os.getenv("GPT_TIMEOUT", "15"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.3"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "2"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# execution_timeout функции: повторы запросов не должны выходить за него,
+# иначе среда выполнения прервет вызов и пользователь останется без ответа
+FUNCTION_TIMEOUT = float(os.getenv("FUNCTION_TIMEOUT", "20"))
+# Запас до конца вызова на отправку пользователю ответа об ошибке
+DEADLINE_MARGIN = float(os.getenv("DEADLINE_MARGIN", "2"))
+
+# Момент (time.monotonic), к которому текущий вызов должен закончить внешние запросы
+_deadline = contextvars.ContextVar("invocation_deadline", default=None)
+# Работа, которая не нужна для ответа (запись и очистка кэшей): выполняется
+# в конце вызова, когда пользователь уже получил ответ
+_after_reply = contextvars.ContextVar("after_reply", default=None)
+
+# Один пул keep-alive соединений к OCR и YandexGPT на весь контейнер
+_http_client = None
+_http_client_loop = None
+
+
+# Задачи закрытия, которые должны дожить до завершения (цикл держит на них лишь слабые ссылки)
+_closing_tasks = set()
+
+
+async def close_stale(name, closing):
+    """
+    Закрывает объект, оставшийся от прежнего цикла событий. Если тот цикл
+    уже закрыт, соединения не закрыть штатно - ошибка только записывается в лог.
+    """
+    try:
+        await closing
+    except Exception as e:
+        logger.warning(f"Не удалось закрыть {name} прежнего цикла событий: {e}")
+
+
+def get_http_client():
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop:
+        import httpx
+        if _http_client is not None:
+            # Соединения старого клиента привязаны к прежнему циклу событий
+            task = loop.create_task(close_stale("HTTP-клиент", _http_client.aclose()))
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+        _http_client = httpx.AsyncClient(
+            headers={"Authorization": f"Api-Key {YC_GPT_API_KEY}"},
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+def backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    # Экспоненциальная задержка с "полным" джиттером
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def remaining_time():
+    deadline = _deadline.get()
+    if deadline is None:
+        return float("inf")
+    return deadline - time.monotonic()
+
+
+def attempt_timeout(timeout):
+    """Таймаут очередной попытки: не дольше, чем осталось до конца вызова."""
+    remaining = remaining_time()
+    if remaining <= 0:
+        raise TimeoutError("Время вызова функции истекло")
+    return min(timeout, remaining)
+
+
+def after_reply(func, *args):
+    """Откладывает func(*args) до конца вызова; вне обработчика выполняет сразу."""
+    pending = _after_reply.get()
+    if pending is None:
+        func(*args)
+    else:
+        pending.append((func, args))
+
+
+async def run_after_reply(pending):
+    # Задачи могут добавлять новые (запись в кэш - его очистку), поэтому список разбирается до конца
+    while pending:
+        func, args = pending.pop(0)
+        if remaining_time() <= 0:
+            logger.warning(f"Время вызова истекло, пропущено отложенных задач: {len(pending) + 1}")
+            return
+        try:
+            await asyncio.to_thread(func, *args)
+        except Exception as e:
+            logger.error(f"Ошибка отложенной задачи: {e}")
+
+
+def can_retry(attempt, timeout, delay):
+    # Повтор имеет смысл, только если после паузы на него остается полный таймаут
+    return attempt < HTTP_MAX_RETRIES and remaining_time() - delay >= timeout
+
+
+async def post_json(url, payload, timeout):
+    import httpx
+    client = get_http_client()
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        current_timeout = attempt_timeout(timeout)
+        try:
+            # Таймаут httpx ограничивает каждую операцию по отдельности, wait_for - запрос целиком
+            response = await asyncio.wait_for(client.post(url, json=payload, timeout=current_timeout), current_timeout)
+        except httpx.TransportError as e:
+            delay = backoff_delay(attempt)
+            if not can_retry(attempt, timeout, delay):
+                raise
+            logger.warning(f"Ошибка соединения с {url}: {e}, повтор")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES:
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            if can_retry(attempt, timeout, delay):
+                logger.warning(f"Ответ {response.status_code} от {url}, повтор")
+                await asyncio.sleep(delay)
+                continue
+        response.raise_for_status()
+        return response.json()
+
+
+GPT_FALLBACK_ANSWER = "Я не смог подготовить ответ на экзаменационный вопрос."
+INSTRUCTION_ERROR_ANSWER = "Не удалось загрузить инструкцию."
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_OBJECTS = int(os.getenv("ANSWER_CACHE_MAX_OBJECTS", "5000"))
+# Устаревшие записи удаляет правило жизненного цикла бакета (main.tf); бот лишь
+# раз в CACHE_TRIM_EVERY записей ограничивает число объектов
+CACHE_TRIM_EVERY = int(os.getenv("CACHE_TRIM_EVERY", "50"))
+
+
+class ObjectCache:
+    """
+    Двухуровневый кэш: LRU в памяти процесса и JSON-объекты в бакете.
+    """
+
+    def __init__(self, name, prefix, max_items, ttl, max_objects):
+        self.name = name
+        self.prefix = prefix
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_objects = max_objects
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.stats = {"memory_hit": 0, "storage_hit": 0, "miss": 0}
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.memory[key] = entry
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_items:
+                self.memory.popitem(last=False)
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+        logger.info(f"Кэш {self.name}: {self.stats}")
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("created_at", 0) < self.ttl
+
+    def get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                self.memory.move_to_end(key)
+        if entry is not None and self.is_fresh(entry):
+            self.count("memory_hit")
+            return entry["value"]
+
+        from botocore.exceptions import ClientError
+        try:
+            response = get_s3_client().get_object(Bucket=YC_STORAGE_BUCKET, Key=self.prefix + key)
+            entry = json.loads(response['Body'].read().decode('utf-8'))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchKey":
+                logger.error(f"Ошибка чтения кэша {self.name}: {e}")
+            entry = None
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша {self.name}: {e}")
+            entry = None
+
+        if entry is not None and self.is_fresh(entry):
+            self.remember(key, entry)
+            self.count("storage_hit")
+            return entry["value"]
+        self.count("miss")
         return None
 
-def get_gpt_response(question_text):
-    instruction = fetch_instruction_from_storage()
-    if not instruction:
-        return "Не удалось загрузить инструкцию."
+    def put(self, key, value):
+        entry = {"value": value, "created_at": time.time()}
+        self.remember(key, entry)
+        try:
+            get_s3_client().put_object(
+                Bucket=YC_STORAGE_BUCKET,
+                Key=self.prefix + key,
+                Body=json.dumps(entry, ensure_ascii=False).encode('utf-8'),
+                ContentType="application/json",
+            )
+        except Exception as e:
+            logger.error(f"Ошибка записи кэша {self.name}: {e}")
+            return
+
+        with self.lock:
+            self.writes += 1
+            trim = self.writes % CACHE_TRIM_EVERY == 0
+        if trim:
+            after_reply(self.trim)
+
+    def trim(self):
+        """Удаляет из бакета самые старые записи сверх max_objects."""
+        try:
+            s3 = get_s3_client()
+            objects = []
+            paginator = s3.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=YC_STORAGE_BUCKET, Prefix=self.prefix):
+                objects.extend(page.get("Contents", []))
+
+            objects.sort(key=lambda obj: obj["LastModified"])
+            stale = [obj["Key"] for obj in objects[:max(0, len(objects) - self.max_objects)]]
+
+            for i in range(0, len(stale), 1000):
+                s3.delete_objects(
+                    Bucket=YC_STORAGE_BUCKET,
+                    Delete={"Objects": [{"Key": key} for key in stale[i:i + 1000]], "Quiet": True},
+                )
+            logger.info(f"Кэш {self.name}: удалено {len(stale)} из {len(objects)} записей")
+        except Exception as e:
+            logger.error(f"Ошибка очистки кэша {self.name}: {e}")
 
-    payload = {
+
+answer_cache = ObjectCache(
+    "ответов", "cache/answers/", ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_OBJECTS
+)
+
+# Латинские буквы, которые OCR путает с похожими кириллическими
+OCR_HOMOGLYPHS = str.maketrans("aeopcxykmthbnur", "аеорсхукмтнвпиг")
+
+
+def normalize_question(text):
+    text = unicodedata.normalize("NFKC", text).lower().replace("ё", "е").replace("\u00ad", "")
+    # Склеиваем слова, разорванные переносом строки
+    text = re.sub(r"(\w)-\s*\n\s*(\w)", r"\1\2", text)
+    text = re.sub(r"[\W_]+", " ", text)
+    words = []
+    for word in text.split():
+        if re.search("[а-я]", word):
+            word = word.translate(OCR_HOMOGLYPHS)
+        words.append(word)
+    return " ".join(words)
+
+
+def instruction_hash(instruction):
+    return hashlib.sha256(instruction.encode('utf-8')).hexdigest()[:16]
+
+
+def completion_payload(instruction, question_text, stream=False):
+    return {
         "modelUri": f"gpt://{YC_PROJECT_FOLDER}/yandexgpt/rc",
-        "completionOptions": {"temperature": 0.5, "maxTokens": 2000},
+        "completionOptions": {"stream": stream, "temperature": 0.5, "maxTokens": 2000},
         "messages": [
             {"role": "system", "text": instruction},
             {"role": "user", "text": question_text},
         ]
     }
 
+
+def completion_text(response):
+    return response.get('result', {}).get('alternatives', [{}])[0].get('message', {}).get('text')
+
+
+async def request_completion(instruction, question_text):
+    with metrics.span("gpt"):
+        response = await post_json(GPT_URL, completion_payload(instruction, question_text), GPT_TIMEOUT)
+    return completion_text(response)
+
+
+async def stream_completion(instruction, question_text):
+    """
+    Читает ответ YandexGPT по мере генерации. Каждая строка потока содержит
+    весь накопленный к этому моменту текст.
+    """
+    import httpx
+    payload = completion_payload(instruction, question_text, stream=True)
+    client = get_http_client()
+    yielded = 0
+    stream_started = time.perf_counter()
+    paused = 0.0
     try:
-        response = requests.post(
-            "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
-            headers={
-                "Accept": "application/json",
-                "Authorization": f"Api-Key {YC_GPT_API_KEY}",
-            },
-            json=payload,
-        )
-        return response.json().get('result', {}).get('alternatives', [{}])[0].get('message', {}).get('text', "Я не смог подготовить ответ на экзаменационный вопрос.")
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            try:
+                async with client.stream("POST", GPT_URL, json=payload, timeout=attempt_timeout(GPT_TIMEOUT)) as response:
+                    if response.status_code in RETRY_STATUS_CODES:
+                        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+                        if can_retry(attempt, GPT_TIMEOUT, delay):
+                            logger.warning(f"Ответ {response.status_code} от {GPT_URL}, повтор")
+                            await asyncio.sleep(delay)
+                            continue
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        # Таймаут httpx действует на каждое чтение, поэтому конец вызова проверяется отдельно
+                        if remaining_time() <= 0:
+                            raise TimeoutError("Время вызова функции истекло")
+                        if not line.strip():
+                            continue
+                        text = completion_text(json.loads(line))
+                        if text:
+                            yielded += 1
+                            yield_started = time.perf_counter()
+                            yield text
+                            paused += time.perf_counter() - yield_started
+                    return
+            except httpx.TransportError as e:
+                # Повторять запрос можно, только пока пользователь еще ничего не увидел
+                delay = backoff_delay(attempt)
+                if yielded or not can_retry(attempt, GPT_TIMEOUT, delay):
+                    raise
+                logger.warning(f"Ошибка соединения с {GPT_URL}: {e}, повтор")
+                await asyncio.sleep(delay)
+    finally:
+        # Только ожидание YandexGPT, без пауз, пока вызывающий код правит сообщение
+        metrics.record("gpt.stream", time.perf_counter() - stream_started - paused, items=yielded)
+
+
+async def prepare_question(question_text):
+    instruction = await asyncio.to_thread(fetch_instruction_from_storage)
+    if not instruction:
+        return None, None
+
+    # Хэш инструкции входит в ключ: при ее изменении старые ответы перестают находиться
+    generation = instruction_hash(instruction)
+    question_hash = hashlib.sha256(normalize_question(question_text).encode('utf-8')).hexdigest()
+    return instruction, f"{generation}/{question_hash}.json"
+
+
+async def get_gpt_response(question_text):
+    instruction, cache_key = await prepare_question(question_text)
+    if not instruction:
+        return INSTRUCTION_ERROR_ANSWER
+
+    answer = await asyncio.to_thread(answer_cache.get, cache_key)
+    if answer:
+        return answer
+
+    try:
+        answer = await request_completion(instruction, question_text)
+    except Exception as e:
+        logger.error(f"Ошибка запроса к YandexGPT API: {e}")
+        return GPT_FALLBACK_ANSWER
+    if not answer:
+        return GPT_FALLBACK_ANSWER
+
+    after_reply(answer_cache.put, cache_key, answer)
+    return answer
+
+
+GPT_STREAMING = os.getenv("GPT_STREAMING", "1") == "1"
+# Правки сообщения не чаще раза в EDIT_INTERVAL секунд и не меньше чем на EDIT_MIN_CHARS символов
+EDIT_INTERVAL = float(os.getenv("EDIT_INTERVAL", "1.5"))
+EDIT_MIN_CHARS = int(os.getenv("EDIT_MIN_CHARS", "150"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+PLACEHOLDER_TEXT = "Готовлю ответ..."
+
+
+def split_text(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    chunks = []
+    while len(text) > limit:
+        # Режем по последнему переводу строки или пробелу перед лимитом
+        cut = text.rfind("\n", 0, limit)
+        if cut < limit // 2:
+            cut = text.rfind(" ", 0, limit)
+        if cut < limit // 2:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip()
+    chunks.append(text)
+    return chunks
+
+
+def log_first_text(started):
+    logger.info(f"Время до первого текста ответа: {time.monotonic() - started:.2f} с")
+
+
+async def send_long_text(message, text, started=None):
+    for i, chunk in enumerate(split_text(text)):
+        await message.reply_text(chunk)
+        if i == 0 and started is not None:
+            log_first_text(started)
+
+
+class StreamingReply:
+    """
+    Ответ, который показывается пользователю по мере генерации: заглушка
+    редактируется пачками, а текст длиннее лимита Telegram переносится
+    в следующие сообщения.
+    """
+
+    def __init__(self, message, started):
+        self.message = message
+        self.started = started
+        self.sent = []
+        self.shown = []
+        self.shown_length = 0
+        self.edited_at = 0.0
+
+    async def start(self):
+        self.sent.append(await self.message.reply_text(PLACEHOLDER_TEXT))
+        self.shown.append(PLACEHOLDER_TEXT)
+
+    async def update(self, text, final=False):
+        first_text = self.shown_length == 0
+        # Первый фрагмент показываем сразу, дальше копим правки по времени и объему
+        if not final and not first_text:
+            if time.monotonic() - self.edited_at < EDIT_INTERVAL:
+                return
+            if len(text) - self.shown_length < EDIT_MIN_CHARS:
+                return
+
+        for i, chunk in enumerate(split_text(text)):
+            if i < len(self.sent):
+                if self.shown[i] != chunk:
+                    await self.edit(i, chunk, final)
+            else:
+                self.sent.append(await self.message.reply_text(chunk))
+                self.shown.append(chunk)
+        self.shown_length = len(text)
+        self.edited_at = max(self.edited_at, time.monotonic())
+        if first_text:
+            log_first_text(self.started)
+
+    async def edit(self, index, text, final):
+        from telegram.error import BadRequest, RetryAfter
+        try:
+            await self.sent[index].edit_text(text)
+        except RetryAfter as e:
+            # Промежуточную правку можно пропустить, итоговую - только отложить
+            if not final:
+                logger.warning(f"Ограничение частоты правок, пропуск на {e.retry_after} с")
+                self.edited_at = time.monotonic() + float(e.retry_after)
+                return
+            await asyncio.sleep(float(e.retry_after))
+            await self.sent[index].edit_text(text)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self.shown[index] = text
+
+
+async def answer_question(message, question_text, started):
+    """
+    Отвечает на вопрос: из кэша, потоково с правками сообщения
+    или одним сообщением, если потоковый режим выключен.
+    """
+    if not GPT_STREAMING:
+        await send_long_text(message, await get_gpt_response(question_text), started)
+        return
+
+    instruction, cache_key = await prepare_question(question_text)
+    if not instruction:
+        await message.reply_text(INSTRUCTION_ERROR_ANSWER)
+        return
+
+    answer = await asyncio.to_thread(answer_cache.get, cache_key)
+    if answer:
+        await send_long_text(message, answer, started)
+        return
+
+    reply = StreamingReply(message, started)
+    await reply.start()
+    answer = None
+    try:
+        async for answer in stream_completion(instruction, question_text):
+            await reply.update(answer)
     except Exception as e:
         logger.error(f"Ошибка запроса к YandexGPT API: {e}")
-        return "Я не смог подготовить ответ на экзаменационный вопрос."
+        # Оборванный ответ не кэшируем, но уже показанный текст оставляем
+        await reply.update(f"{answer}\n\n{GPT_FALLBACK_ANSWER}" if answer else GPT_FALLBACK_ANSWER, final=True)
+        return
+
+    if not answer:
+        await reply.update(GPT_FALLBACK_ANSWER, final=True)
+        return
+    await reply.update(answer, final=True)
+    after_reply(answer_cache.put, cache_key, answer)
+
+
+async def recognize_text(image_data):
+    ocr_payload = {"mimeType": "JPEG", "languageCodes": ["ru"], "model": "page", "content": image_data}
+    with metrics.span("ocr", bytes_=len(image_data)):
+        response = await post_json(OCR_URL, ocr_payload, OCR_TIMEOUT)
+    return response.get('result', {}).get('textAnnotation', {}).get('fullText', '')
+
+
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "512"))
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", str(30 * 24 * 3600)))
+OCR_CACHE_MAX_OBJECTS = int(os.getenv("OCR_CACHE_MAX_OBJECTS", "20000"))
+
+ocr_cache = ObjectCache("OCR", "cache/ocr/", OCR_CACHE_SIZE, OCR_CACHE_TTL, OCR_CACHE_MAX_OBJECTS)
+_ocr_stats = {"requests": 0, "hits": 0, "bytes_saved": 0}
+
+
+def count_ocr(hit, saved_bytes=0):
+    _ocr_stats["requests"] += 1
+    if hit:
+        _ocr_stats["hits"] += 1
+        _ocr_stats["bytes_saved"] += saved_bytes
+    hit_rate = _ocr_stats["hits"] / _ocr_stats["requests"]
+    logger.info(
+        f"OCR-кэш: попаданий {hit_rate:.0%} из {_ocr_stats['requests']}, "
+        f"сэкономлено {_ocr_stats['bytes_saved']} байт"
+    )
+
+
+def base64_size(size):
+    return (size + 2) // 3 * 4
+
+
+# Минимальная короткая сторона, при которой OCR еще уверенно читает текст
+OCR_MIN_SIDE = int(os.getenv("OCR_MIN_SIDE", "720"))
+# Длинная сторона, до которой уменьшается слишком большое изображение
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "1600"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "80"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "1") == "1"
+
+
+def choose_photo_size(photos):
+    """
+    Выбирает самый маленький из размеров фотографии, который еще
+    не меньше OCR_MIN_SIDE по короткой стороне.
+    """
+    for photo in sorted(photos, key=lambda p: p.width * p.height):
+        if min(photo.width, photo.height) >= OCR_MIN_SIDE:
+            return photo
+    return max(photos, key=lambda p: p.width * p.height)
+
+
+def prepare_image(image_bytes):
+    """
+    Уменьшает, переводит в оттенки серого и пережимает изображение в памяти,
+    если оно больше OCR_MAX_SIDE по длинной стороне.
+    """
+    try:
+        from PIL import Image
+        image = Image.open(io.BytesIO(image_bytes))
+        if max(image.size) <= OCR_MAX_SIDE:
+            return image_bytes
+        image.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+        image = image.convert("L" if OCR_GRAYSCALE else "RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.error(f"Ошибка подготовки изображения: {e}")
+        return image_bytes
+
+    prepared = output.getvalue()
+    return prepared if len(prepared) < len(image_bytes) else image_bytes
+
+
+async def recognize_photo(photo):
+    """
+    Распознает текст на фотографии, используя кэш по file_unique_id
+    и по хэшу содержимого файла.
+    """
+    # file_unique_id одинаков для пересланных копий одной и той же фотографии
+    uid_key = f"uid/{photo.file_unique_id}.json"
+    ocr_text = await asyncio.to_thread(ocr_cache.get, uid_key)
+    if ocr_text is not None:
+        count_ocr(True, (photo.file_size or 0) + base64_size(photo.file_size or 0))
+        return ocr_text
+
+    file = await photo.get_file()
+    image_stream = io.BytesIO()
+    await file.download_to_memory(image_stream)
+    image_bytes = image_stream.getvalue()
+
+    content_key = f"sha256/{hashlib.sha256(image_bytes).hexdigest()}.json"
+    ocr_text = await asyncio.to_thread(ocr_cache.get, content_key)
+    if ocr_text is not None:
+        count_ocr(True, base64_size(len(image_bytes)))
+    else:
+        with metrics.span("image.prepare", bytes_=len(image_bytes)):
+            prepared_bytes = await asyncio.to_thread(prepare_image, image_bytes)
+        image_data = base64.b64encode(prepared_bytes).decode("utf-8")
+        started = time.monotonic()
+        ocr_text = await recognize_text(image_data)
+        logger.info(
+            f"OCR: фото {photo.width}x{photo.height}, {len(image_bytes)} байт, "
+            f"после подготовки {len(prepared_bytes)} байт, "
+            f"запрос {len(image_data)} байт, {time.monotonic() - started:.2f} с"
+        )
+        count_ocr(False)
+        # Запись в кэш не нужна для ответа: она выполнится после отправки ответа
+        after_reply(ocr_cache.put, content_key, ocr_text)
+    after_reply(ocr_cache.put, uid_key, ocr_text)
+    return ocr_text
 
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -88,36 +753,147 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def process_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    started = time.monotonic()
     question_text = update.message.text
     logger.info(f"Запрос: {question_text}")
-    response = get_gpt_response(question_text)
-    await update.message.reply_text(response)
+    await answer_question(update.message, question_text, started)
 
 
-async def process_image_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.message.media_group_id:
-        await update.message.reply_text(
-            "Я могу обработать только одну фотографию."
+MEDIA_GROUP_PREFIX = "media_groups/"
+# Сколько ждать остальные фотографии альбома, прежде чем собирать вопрос
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", "2.5"))
+MEDIA_GROUP_CONCURRENCY = int(os.getenv("MEDIA_GROUP_CONCURRENCY", "3"))
+MEDIA_GROUP_DONE = "done"
+
+
+def store_media_group_part(group_id, message_id, photo):
+    part = {
+        "message_id": message_id,
+        "file_id": photo.file_id,
+        "file_unique_id": photo.file_unique_id,
+        "width": photo.width,
+        "height": photo.height,
+        "file_size": photo.file_size,
+    }
+    get_s3_client().put_object(
+        Bucket=YC_STORAGE_BUCKET,
+        Key=f"{MEDIA_GROUP_PREFIX}{group_id}/{message_id:012d}.json",
+        Body=json.dumps(part).encode('utf-8'),
+        ContentType="application/json",
+    )
+
+
+def list_media_group(group_id):
+    response = get_s3_client().list_objects_v2(Bucket=YC_STORAGE_BUCKET, Prefix=f"{MEDIA_GROUP_PREFIX}{group_id}/")
+    return [obj["Key"] for obj in response.get("Contents", [])]
+
+
+def load_media_group_part(key):
+    response = get_s3_client().get_object(Bucket=YC_STORAGE_BUCKET, Key=key)
+    return json.loads(response['Body'].read().decode('utf-8'))
+
+
+def mark_media_group_done(group_id, message_ids):
+    # В маркере - сообщения, вошедшие в альбом: по нему опоздавшая фотография узнает, что ее не учли
+    get_s3_client().put_object(
+        Bucket=YC_STORAGE_BUCKET,
+        Key=f"{MEDIA_GROUP_PREFIX}{group_id}/{MEDIA_GROUP_DONE}",
+        Body=json.dumps(message_ids).encode('utf-8'),
+        ContentType="application/json",
+    )
+
+
+def load_media_group_done(group_id):
+    response = get_s3_client().get_object(Bucket=YC_STORAGE_BUCKET, Key=f"{MEDIA_GROUP_PREFIX}{group_id}/{MEDIA_GROUP_DONE}")
+    return json.loads(response['Body'].read().decode('utf-8') or "[]")
+
+
+async def collect_media_group(message, photo):
+    """
+    Каждая фотография альбома приходит отдельным вызовом функции, поэтому
+    части складываются в бакет. Собирает альбом тот вызов, чье сообщение
+    оказалось последним после ожидания; остальные возвращают None.
+    Фотографии, пришедшей уже после сборки, вызов отвечает, что ее не учли.
+    """
+    group_id = message.media_group_id
+    await asyncio.to_thread(store_media_group_part, group_id, message.message_id, photo)
+    await asyncio.sleep(MEDIA_GROUP_WAIT)
+
+    keys = await asyncio.to_thread(list_media_group, group_id)
+    if any(key.endswith(f"/{MEDIA_GROUP_DONE}") for key in keys):
+        collected = await asyncio.to_thread(load_media_group_done, group_id)
+        if message.message_id not in collected:
+            # Фотография пришла позже MEDIA_GROUP_WAIT, и ответ на альбом ее не учитывает
+            logger.warning(f"Альбом {group_id}: сообщение {message.message_id} пришло после сборки альбома")
+            await message.reply_text(
+                "Эта страница пришла после того, как альбом был собран, и в ответ не вошла. "
+                "Отправьте ее еще раз."
             )
-        return
+        return None
+    if max(keys) != f"{MEDIA_GROUP_PREFIX}{group_id}/{message.message_id:012d}.json":
+        return None
 
-    photo = update.message.photo[-1]
-    file = await photo.get_file()
-    image_stream = io.BytesIO()
-    await file.download_to_memory(image_stream)
-    image_data = base64.b64encode(image_stream.getvalue()).decode("utf-8")
+    message_ids = [int(key.rsplit("/", 1)[-1].removesuffix(".json")) for key in keys]
+    await asyncio.to_thread(mark_media_group_done, group_id, message_ids)
 
-    ocr_payload = {"mimeType": "JPEG", "languageCodes": ["ru"], "model": "page", "content": image_data}
+    parts = await asyncio.gather(*(asyncio.to_thread(load_media_group_part, key) for key in keys))
+    return sorted(parts, key=lambda part: part["message_id"])
+
+
+async def recognize_media_group(parts, bot):
+    from telegram import PhotoSize
+    semaphore = asyncio.Semaphore(MEDIA_GROUP_CONCURRENCY)
+
+    async def recognize_part(part):
+        photo = PhotoSize(
+            part["file_id"], part["file_unique_id"], part["width"], part["height"], part.get("file_size")
+        )
+        photo.set_bot(bot)
+        async with semaphore:
+            try:
+                return await recognize_photo(photo)
+            except Exception as e:
+                logger.error(f"Ошибка OCR для сообщения {part['message_id']}: {e}")
+                return ""
+
+    # gather сохраняет порядок частей, то есть порядок страниц
+    texts = await asyncio.gather(*(recognize_part(part) for part in parts))
+    return "\n\n".join(text for text in texts if text)
+
+
+async def process_media_group_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    started = time.monotonic()
+    photo = choose_photo_size(update.message.photo)
     try:
-        response = requests.post(
-            "https://ocr.api.cloud.yandex.net/ocr/v1/recognizeText",
-            headers={"Authorization": f"Api-Key {YC_GPT_API_KEY}", "Content-Type": "application/json"},
-            json=ocr_payload,
+        parts = await collect_media_group(update.message, photo)
+        if parts is None:
+            return
+        logger.info(f"Альбом {update.message.media_group_id}: {len(parts)} фотографий")
+        ocr_text = await recognize_media_group(parts, context.bot)
+        if ocr_text:
+            await answer_question(update.message, ocr_text, started)
+        else:
+            await update.message.reply_text(
+                "Я не могу обработать эти фотографии."
+            )
+    except Exception as e:
+        logger.error(f"Ошибка обработки альбома: {e}")
+        await update.message.reply_text(
+            "Я не могу обработать эти фотографии."
         )
-        ocr_text = response.json().get('result', {}).get('textAnnotation', {}).get('fullText', '')
+
+
+async def process_image_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message.media_group_id:
+        await process_media_group_message(update, context)
+        return
+
+    started = time.monotonic()
+    photo = choose_photo_size(update.message.photo)
+    try:
+        ocr_text = await recognize_photo(photo)
         if ocr_text:
-            answer = get_gpt_response(ocr_text)
-            await update.message.reply_text(answer)
+            await answer_question(update.message, ocr_text, started)
         else:
             await update.message.reply_text(
                 "Я не могу обработать эту фотографию."
@@ -135,20 +911,185 @@ async def process_unknown_message(update: Update, context: ContextTypes.DEFAULT_
     )
 
 
-async def handler(event, context):
+def build_request():
+    """HTTP-клиент бота, который замеряет каждый вызов Bot API как этап telegram.{метод}."""
+    from telegram.request import HTTPXRequest
+
+    class InstrumentedRequest(HTTPXRequest):
+        async def do_request(self, url, method, request_data=None, *args, **kwargs):
+            name = "telegram.download" if "/file/bot" in url else f"telegram.{url.rsplit('/', 1)[-1]}"
+            with metrics.span(name) as stage:
+                code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+                stage.add(bytes_=len(payload))
+                return code, payload
+
+    # Размер пула тот же, что ApplicationBuilder задает по умолчанию
+    return InstrumentedRequest(connection_pool_size=256)
+
+
+async def handle_error(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Application.process_update перехватывает исключения обработчиков сам, поэтому
+    сбои сети и HTTP-сессии бота видны только здесь: после них приложение
+    помечается на пересборку перед следующим обновлением.
+    """
+    global _application_failed
+    from telegram.error import BadRequest, NetworkError
+    error = context.error
+    logger.error(f"Ошибка обработки обновления: {error}", exc_info=error)
+    if isinstance(error, NetworkError) and not isinstance(error, BadRequest) and context.application is _application:
+        _application_failed = True
+
+
+def build_application():
+    from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_API_TOKEN)
+        .base_url(f"{TELEGRAM_BASE_URL}/bot")
+        .base_file_url(f"{TELEGRAM_BASE_URL}/file/bot")
+        .request(build_request())
+        .build()
+    )
+    app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("help", start_command))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_text_message))
+    app.add_handler(MessageHandler(filters.PHOTO, process_image_message))
+    app.add_handler(MessageHandler(filters.ALL, process_unknown_message))
+    app.add_error_handler(handle_error)
+    return app
+
+
+# Приложение вместе с HTTP-сессией бота создается один раз на контейнер
+# и переиспользуется всеми обновлениями, пока экземпляр функции "теплый".
+_application = None
+_application_loop = None
+_application_lock = None
+# Выставляется handle_error, когда приложение нужно пересобрать
+_application_failed = False
+
+
+async def get_application():
+    global _application, _application_loop, _application_lock
+    loop = asyncio.get_running_loop()
+    if _application_loop is not loop:
+        # HTTP-сессия привязана к циклу событий, на новом цикле ее не переиспользовать
+        if _application is not None:
+            logger.info("Цикл событий сменился, приложение будет создано заново")
+            await close_stale("приложение", _application.shutdown())
+        _application = None
+        _application_loop = loop
+        _application_lock = asyncio.Lock()
+
+    async with _application_lock:
+        if _application is None:
+            app = build_application()
+            await app.initialize()
+            _application = app
+            logger.info("Приложение Telegram инициализировано")
+    return _application
+
+
+async def reset_application():
+    global _application, _application_failed
+    app, _application = _application, None
+    _application_failed = False
+    if app is None:
+        return
+    try:
+        await app.shutdown()
+    except Exception as e:
+        logger.error(f"Ошибка остановки приложения: {e}")
+
+
+async def close_http_client():
+    global _http_client
+    client, _http_client = _http_client, None
+    if client is not None:
+        await client.aclose()
+
+
+def shutdown_application():
+    # Вызывается при завершении процесса, когда среда выполнения утилизирует экземпляр
+    loop = _application_loop or _http_client_loop
+    if loop is None or loop.is_closed() or loop.is_running():
+        return
+    try:
+        loop.run_until_complete(reset_application())
+        if _http_client_loop is loop:
+            loop.run_until_complete(close_http_client())
+    except Exception as e:
+        logger.error(f"Ошибка остановки приложения: {e}")
+
+
+atexit.register(shutdown_application)
+
+
+def handle_sigterm(signum, frame):
+    """
+    Среда выполнения останавливает экземпляр сигналом SIGTERM, а при нем
+    Python не вызывает atexit: приложение останавливается здесь, затем
+    сигнал передается прежнему обработчику.
+    """
+    shutdown_application()
+    if callable(_previous_sigterm):
+        _previous_sigterm(signum, frame)
+        return
+    if _previous_sigterm != signal.SIG_IGN:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+_previous_sigterm = None
+try:
+    _previous_sigterm = signal.signal(signal.SIGTERM, handle_sigterm)
+except ValueError:
+    # Модуль загружен не в главном потоке: обработчик сигнала не установить, остается atexit
+    pass
+
+
+async def handle_update_per_request(body):
+    from telegram import Update
+    app = build_application()
+    await app.initialize()
     try:
-        body = json.loads(event.get('body', '{}'))
-        app = ApplicationBuilder().token(TELEGRAM_API_TOKEN).build()
-        app.add_handler(CommandHandler("start", start_command))
-        app.add_handler(CommandHandler("help", start_command))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_text_message))
-        app.add_handler(MessageHandler(filters.PHOTO, process_image_message))
-        app.add_handler(MessageHandler(filters.ALL, process_unknown_message))
-
-        await app.initialize()
         await app.process_update(Update.de_json(body, app.bot))
+    finally:
         await app.shutdown()
+
+
+@metrics.instrument_handler("task1_bot")
+async def handler(event, context):
+    from telegram import Update
+    _deadline.set(time.monotonic() + FUNCTION_TIMEOUT - DEADLINE_MARGIN)
+    pending = []
+    _after_reply.set(pending)
+    try:
+        body = json.loads(event.get('body', '{}'))
+        if APP_LIFECYCLE == "per_request":
+            await handle_update_per_request(body)
+        else:
+            app = await get_application()
+            await app.process_update(Update.de_json(body, app.bot))
+            if _application_failed:
+                logger.warning("Сбой сети в обработчике, приложение будет создано заново")
+                await reset_application()
+        await run_after_reply(pending)
         return {'statusCode': 200, 'body': 'OK'}
     except Exception as e:
         logger.error(f"Ошибка обработчика: {e}")
+        # Следующее обновление получит заново собранное приложение
+        await reset_application()
         return {'statusCode': 500, 'body': 'Internal Server Error'}
+
+
+def preload():
+    """Импортирует тяжелые модули и создает клиент хранилища при загрузке функции."""
+    import httpx
+    from PIL import Image
+    from telegram.ext import ApplicationBuilder
+    get_s3_client()
+
+
+if STARTUP_MODE == "eager":
+    preload()
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from telegram.error import NetworkError
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import bot  # noqa: E402
+
+UPDATES = 20
+FAILING_UPDATE = 5
+
+
+class FakeBotApiRequest(BaseRequest):
+    """Отвечает на getMe без сети, чтобы Application.initialize работал как настоящий."""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        result = {"id": 1, "is_bot": True, "first_name": "test", "username": "test_bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {"build": 0, "initialize": 0, "shutdown": 0, "processed": 0}
+    build_application = bot.build_application
+    initialize = Application.initialize
+    shutdown = Application.shutdown
+
+    def counting_build_application():
+        calls["build"] += 1
+        return build_application()
+
+    async def counting_initialize(self):
+        calls["initialize"] += 1
+        await initialize(self)
+
+    async def counting_shutdown(self):
+        calls["shutdown"] += 1
+        await shutdown(self)
+
+    async def process_text_message(update, context):
+        calls["processed"] += 1
+        if update.update_id == FAILING_UPDATE and calls.get("fail"):
+            raise NetworkError("сессия бота сломана")
+
+    monkeypatch.setattr(bot, "APP_LIFECYCLE", "warm")
+    monkeypatch.setattr(bot, "TELEGRAM_API_TOKEN", "123:test")
+    monkeypatch.setattr(bot, "build_request", FakeBotApiRequest)
+    monkeypatch.setattr(bot, "build_application", counting_build_application)
+    monkeypatch.setattr(bot, "process_text_message", process_text_message)
+    monkeypatch.setattr(Application, "initialize", counting_initialize)
+    monkeypatch.setattr(Application, "shutdown", counting_shutdown)
+    monkeypatch.setattr(bot, "_application", None)
+    monkeypatch.setattr(bot, "_application_loop", None)
+    monkeypatch.setattr(bot, "_application_lock", None)
+    monkeypatch.setattr(bot, "_application_failed", False)
+    return calls
+
+
+def event(update_id):
+    message = {"message_id": update_id, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "Что такое процесс?"}
+    return {"body": json.dumps({"update_id": update_id, "message": message})}
+
+
+def run_updates(update_ids):
+    loop = asyncio.new_event_loop()
+    try:
+        return [loop.run_until_complete(bot.handler(event(update_id), None)) for update_id in update_ids]
+    finally:
+        loop.run_until_complete(bot.reset_application())
+        loop.close()
+
+
+def test_initialize_runs_once_for_many_updates(calls):
+    responses = run_updates(range(UPDATES))
+
+    assert [response["statusCode"] for response in responses] == [200] * UPDATES
+    assert calls["processed"] == UPDATES
+    assert calls["build"] == 1
+    assert calls["initialize"] == 1
+
+
+def test_network_error_rebuilds_application_once(calls):
+    calls["fail"] = True
+    responses = run_updates(range(UPDATES))
+
+    # Application сам перехватывает ошибку обработчика, поэтому ответ остается 200
+    assert [response["statusCode"] for response in responses] == [200] * UPDATES
+    assert calls["processed"] == UPDATES
+    assert calls["build"] == 2
+    assert calls["initialize"] == 2
+    # Одна остановка сломанного приложения и одна - нового в конце прогона
+    assert calls["shutdown"] == 2
@@ -32,4 +32,9 @@ variable "aws_secret_access_key" {
 variable "yandex_api_key" {
   type        = string
   sensitive   = true
-}
\ No newline at end of file
+}
+
+variable "metrics_sample_rate" {
+  type    = string
+  default = "1"
+}
@@ -1,56 +1,343 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import quote, unquote
 from uuid import uuid4
-import boto3
 import os
 import json
-import requests
+import random
+import sys
+import threading
+import time
+
+try:
+    import metrics
+except ImportError:
+    # Локальный запуск из репозитория: общий модуль лежит в каталоге common
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+    import metrics
 
 PROCESSED_FACES_BUCKET_NAME = os.getenv("PROCESSED_FACES_BUCKET_NAME")
 IMAGES_BUCKET_NAME = os.getenv("IMAGES_BUCKET_NAME")
 TG_BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{TG_BOT_TOKEN}"
+TELEGRAM_API_URL = f"{os.getenv('TELEGRAM_BASE_URL', 'https://api.telegram.org')}/bot{TG_BOT_TOKEN}"
 YANDEX_STORAGE_ACCESS_KEY = os.getenv("YANDEX_STORAGE_ACCESS_KEY")
 YANDEX_STORAGE_SECRET_KEY = os.getenv("YANDEX_STORAGE_SECRET_KEY")
 API_GATEWAY = os.getenv("API_GATEWAY")
 API_GATEWAY_ORIGINAL = os.getenv("API_GATEWAY_ORIGINAL")
 
-# Инициализация клиента для S3
-s3_client = boto3.client(
-    "s3",
-    endpoint_url="https://storage.yandexcloud.net",
-    aws_access_key_id=YANDEX_STORAGE_ACCESS_KEY,
-    aws_secret_access_key=YANDEX_STORAGE_SECRET_KEY,
-)
+# lazy - boto3 и requests импортируются, а клиенты создаются при первом использовании
+# (например, /start не обращается к хранилищу); eager - все загружается вместе с функцией
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+
+# Индекс в бакете лиц из пустых объектов-маркеров:
+#   index/unnamed/{face_key} - лицо еще без имени
+#   index/names/{имя}/{ключ оригинала}/{face_key} - лицо с именем на оригинале
+INDEX_PREFIX = "index/"
+UNNAMED_INDEX_PREFIX = "index/unnamed/"
+NAMES_INDEX_PREFIX = "index/names/"
+INDEX_REBUILD_WORKERS = int(os.getenv("INDEX_REBUILD_WORKERS", "16"))
+
+# Аренды лиц разметчиками (index/leases/{face_key}) и сессии пользователей
+# (index/sessions/{chat_id}.json) хранятся в бакете и общие для всех экземпляров функции
+LEASE_PREFIX = "index/leases/"
+SESSION_PREFIX = "index/sessions/"
+# Брошенные аренды и сессии удаляет правило жизненного цикла бакета (см. main.tf)
+LEASE_TTL = int(os.getenv("LEASE_TTL", "600"))
+# Безымянные лица читаются страницами; на странице пробуется не больше LEASE_CLAIM_ATTEMPTS лиц
+UNNAMED_SCAN_LIMIT = int(os.getenv("UNNAMED_SCAN_LIMIT", "200"))
+LEASE_CLAIM_ATTEMPTS = int(os.getenv("LEASE_CLAIM_ATTEMPTS", "5"))
+# Сколько раз перечитывать метаданные, если crop_face изменил их во время сохранения имени
+NAME_UPDATE_ATTEMPTS = 3
+
+# Отправка результатов /find: альбомы по 10 фото, несколько альбомов одновременно
+MEDIA_GROUP_SIZE = 10
+FIND_PAGE_SIZE = int(os.getenv("FIND_PAGE_SIZE", "30"))
+FIND_CONCURRENCY = int(os.getenv("FIND_CONCURRENCY", "3"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "10"))
+TELEGRAM_MAX_RETRIES = 3
+
+# Клиент S3 и одна keep-alive сессия к Telegram на весь экземпляр функции
+_s3_client = None
+_http_session = None
+_clients_lock = threading.Lock()
+telegram_executor = ThreadPoolExecutor(max_workers=FIND_CONCURRENCY)
+storage_executor = ThreadPoolExecutor(max_workers=MEDIA_GROUP_SIZE)
+
+# file_id фотографий, уже отправленных в Telegram: повторная отправка по file_id
+# не заставляет Telegram заново скачивать изображение через API Gateway
+FILE_ID_PREFIX = "index/file_ids/"
+FACE_PHOTO = "faces"
+ORIGINAL_PHOTO = "originals"
+file_ids = {}
 
-user_sessions = {}
 
-def get_unnamed_face():
-    response = s3_client.list_objects_v2(Bucket=PROCESSED_FACES_BUCKET_NAME)
-    if "Contents" not in response:
-        return None, None
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        with _clients_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = metrics.instrument_boto3(boto3.client(
+                    "s3",
+                    endpoint_url="https://storage.yandexcloud.net",
+                    aws_access_key_id=YANDEX_STORAGE_ACCESS_KEY,
+                    aws_secret_access_key=YANDEX_STORAGE_SECRET_KEY,
+                ))
+    return _s3_client
 
-    for obj in response["Contents"]:
-        if obj["Key"].endswith(".json"):
-            metadata = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=obj["Key"])
-            metadata = json.loads(metadata["Body"].read().decode("utf-8"))
-            if metadata.get("name") is None:
-                return metadata["face_key"], obj["Key"]
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        with _clients_lock:
+            if _http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=FIND_CONCURRENCY))
+                _http_session = session
+    return _http_session
 
+def name_index_prefix(name):
+    return f"{NAMES_INDEX_PREFIX}{quote(name, safe='')}/"
+
+def name_index_key(name, original_key, face_key):
+    return f"{name_index_prefix(name)}{quote(original_key, safe='')}/{face_key}"
+
+def unnamed_index_key(face_key):
+    return f"{UNNAMED_INDEX_PREFIX}{face_key}"
+
+def get_unnamed_face(chat_id):
+    """
+    Выдает пользователю безымянное лицо, на которое нет чужой действующей аренды,
+    и берет его в аренду на LEASE_TTL секунд. Занятость лиц проверяет сама
+    claim_lease; если на странице все опробованные лица заняты, берется следующая.
+    """
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    pages = paginator.paginate(
+        Bucket=PROCESSED_FACES_BUCKET_NAME, Prefix=UNNAMED_INDEX_PREFIX, PaginationConfig={"PageSize": UNNAMED_SCAN_LIMIT}
+    )
+    for page in pages:
+        candidates = [obj["Key"][len(UNNAMED_INDEX_PREFIX):] for obj in page.get("Contents", [])]
+        random.shuffle(candidates)
+        for face_key in candidates[:LEASE_CLAIM_ATTEMPTS]:
+            if claim_lease(face_key, chat_id):
+                return face_key, face_key.replace(".jpg", ".json")
     return None, None
 
+def is_precondition_failed(error):
+    # 412 - условие IfNoneMatch/IfMatch не выполнено, 409 - параллельная условная запись того же ключа
+    code = error.response.get("Error", {}).get("Code")
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409") or status in (412, 409)
+
+def lease_key(face_key):
+    return f"{LEASE_PREFIX}{face_key}"
+
+def write_lease(face_key, chat_id, **condition):
+    """
+    Условно записывает аренду. Возвращает ETag записи или None, если условие
+    не выполнено: аренда уже существует (IfNoneMatch="*") или изменилась (IfMatch).
+    """
+    from botocore.exceptions import ClientError
+    try:
+        response = get_s3_client().put_object(
+            Bucket=PROCESSED_FACES_BUCKET_NAME,
+            Key=lease_key(face_key),
+            Body=json.dumps({"chat_id": chat_id}),
+            ContentType="application/json",
+            **condition
+        )
+    except ClientError as e:
+        if is_precondition_failed(e):
+            return None
+        raise
+    return response["ETag"]
+
+def read_lease(face_key):
+    """
+    Возвращает (chat_id, ETag, истекла ли аренда) или None, если аренды нет.
+    """
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=lease_key(face_key))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    owner = json.loads(response["Body"].read().decode("utf-8")).get("chat_id")
+    expired = response["LastModified"].timestamp() <= time.time() - LEASE_TTL
+    return owner, response["ETag"], expired
+
+def claim_lease(face_key, chat_id):
+    """
+    Берет лицо в аренду. Новая аренда создается условной записью IfNoneMatch="*",
+    поэтому из одновременных претендентов ключ создает только один. Истекшая
+    аренда перезаписывается с IfMatch по ее ETag: если ее успел перехватить
+    или продлить кто-то другой, запись отклоняется.
+    """
+    if write_lease(face_key, chat_id, IfNoneMatch="*"):
+        return True
+    lease = read_lease(face_key)
+    if lease is None:
+        # Аренду только что сняли; лицо достанется следующему запросу
+        return False
+    owner, etag, expired = lease
+    if not expired:
+        return False
+    return write_lease(face_key, chat_id, IfMatch=etag) is not None
+
+def renew_lease(face_key, chat_id):
+    """
+    Проверяет, что аренда по-прежнему принадлежит chat_id, и продлевает ее
+    условной записью по ETag. Возвращает новый ETag или None, если аренда потеряна.
+    """
+    lease = read_lease(face_key)
+    if lease is None or lease[0] != chat_id:
+        return None
+    return write_lease(face_key, chat_id, IfMatch=lease[1])
+
+def release_lease(face_key, chat_id, etag=None):
+    """
+    Снимает аренду, только если она принадлежит chat_id: после истечения
+    срока лицо могло достаться другому разметчику, и его аренду трогать нельзя.
+    """
+    from botocore.exceptions import ClientError
+    if etag is None:
+        lease = read_lease(face_key)
+        if lease is None or lease[0] != chat_id:
+            return
+        etag = lease[1]
+    try:
+        get_s3_client().delete_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=lease_key(face_key), IfMatch=etag)
+    except ClientError as e:
+        if not is_precondition_failed(e):
+            raise
+
+def session_key(chat_id):
+    return f"{SESSION_PREFIX}{chat_id}.json"
+
+def load_session(chat_id):
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=session_key(chat_id))
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+    return json.loads(response["Body"].read().decode("utf-8"))
+
+def save_session(chat_id, session):
+    get_s3_client().put_object(
+        Bucket=PROCESSED_FACES_BUCKET_NAME,
+        Key=session_key(chat_id),
+        Body=json.dumps(session),
+        ContentType="application/json"
+    )
+
+def delete_session(chat_id):
+    get_s3_client().delete_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=session_key(chat_id))
+
+def store_session(chat_id, session):
+    if session:
+        save_session(chat_id, session)
+    else:
+        delete_session(chat_id)
+
+def original_keys(metadata):
+    """
+    Ключи всех оригиналов с лицом: те же байты, загруженные под другим ключом,
+    detect_face добавляет в original_photo_keys.
+    """
+    return metadata.get("original_photo_keys") or [metadata["original_photo_key"]]
+
+def update_name_index(metadata, old_name):
+    face_key = metadata["face_key"]
+    for original_key in original_keys(metadata):
+        if old_name:
+            get_s3_client().delete_object(
+                Bucket=PROCESSED_FACES_BUCKET_NAME,
+                Key=name_index_key(old_name, original_key, face_key)
+            )
+        get_s3_client().put_object(
+            Bucket=PROCESSED_FACES_BUCKET_NAME,
+            Key=name_index_key(metadata["name"], original_key, face_key),
+            Body=b""
+        )
+    get_s3_client().delete_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=unnamed_index_key(face_key))
+
+def list_objects(bucket, prefix="", start_after=None):
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    for page in paginator.paginate(**params):
+        yield from page.get("Contents", [])
+
+def list_keys(bucket, prefix="", start_after=None):
+    for obj in list_objects(bucket, prefix, start_after):
+        yield obj["Key"]
+
+def load_metadata(metadata_key):
+    response = get_s3_client().get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=metadata_key)
+    return json.loads(response["Body"].read().decode("utf-8"))
+
+def delete_keys(keys):
+    """
+    Удаляет объекты из бакета лиц пачками по 1000 ключей.
+    """
+    for i in range(0, len(keys), 1000):
+        get_s3_client().delete_objects(
+            Bucket=PROCESSED_FACES_BUCKET_NAME,
+            Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True}
+        )
+
+def rebuild_index():
+    """
+    Полностью пересобирает индекс по всем файлам метаданных в бакете лиц.
+    """
+    metadata_keys = [
+        key for key in list_keys(PROCESSED_FACES_BUCKET_NAME)
+        if key.endswith(".json") and not key.startswith(INDEX_PREFIX)
+    ]
+    print(f"Найдено файлов метаданных: {len(metadata_keys)}")
+
+    with ThreadPoolExecutor(max_workers=INDEX_REBUILD_WORKERS) as executor:
+        expected = set()
+        for metadata in executor.map(load_metadata, metadata_keys):
+            if metadata.get("name"):
+                expected.update(
+                    name_index_key(metadata["name"], original_key, metadata["face_key"])
+                    for original_key in original_keys(metadata)
+                )
+            else:
+                expected.add(unnamed_index_key(metadata["face_key"]))
+
+        existing = set(list_keys(PROCESSED_FACES_BUCKET_NAME, UNNAMED_INDEX_PREFIX))
+        existing.update(list_keys(PROCESSED_FACES_BUCKET_NAME, NAMES_INDEX_PREFIX))
+
+        missing = sorted(expected - existing)
+        list(executor.map(
+            lambda key: get_s3_client().put_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=key, Body=b""),
+            missing
+        ))
+
+    stale = sorted(existing - expected)
+    delete_keys(stale)
+    print(f"Индекс пересобран: добавлено {len(missing)}, удалено {len(stale)}, всего {len(expected)}")
+
 def get_face(chat_id):
-    face_key, metadata_key = get_unnamed_face()
+    # Предыдущее невыполненное задание пользователя возвращается в очередь
+    previous = load_session(chat_id)
+    if previous.get("face_key"):
+        release_lease(previous["face_key"], chat_id)
+
+    face_key, metadata_key = get_unnamed_face(chat_id)
     if not face_key:
-        send_message(chat_id, "Нет фотографий без имени.")
+        send_message(chat_id, "Нет свободных фотографий без имени.")
         return
 
-    face_url = f"{API_GATEWAY}/?face={face_key}"
-    send_photo(chat_id, face_url)
+    face_url = photo_url(FACE_PHOTO, face_key)
+    send_stored_photo(chat_id, FACE_PHOTO, face_key)
 
-    user_sessions[chat_id] = {"metadata_key": metadata_key, "face_url": face_url}
+    previous.update({"face_key": face_key, "metadata_key": metadata_key, "face_url": face_url})
+    save_session(chat_id, previous)
     print(f"Сохранение имени для фотографии: {metadata_key}")  
-    metadata = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=metadata_key)
-    metadata = json.loads(metadata["Body"].read().decode("utf-8"))
-    print(f"Метаданные фотографии перед изменением: {metadata}")  
 
 def find_photo(chat_id, name):
     print(f"получена команда /find с текстом - {name}")  
@@ -61,7 +348,7 @@ def find_photo(chat_id, name):
         return
 
     print(f"Начинаем поиск фотографий для имени: {name}")  
-    found_photos = search_original_photos_by_name(name)
+    found_photos, has_more = search_original_photos_by_name(name)
     
     if found_photos is None:
         print(f"Ошибка: функция search_original_photos_by_name вернула None для имени {name}")  
@@ -73,85 +360,320 @@ def find_photo(chat_id, name):
         send_message(chat_id, f"Фотографии с именем {name} не найдены.")
         return
 
-    print(f"Найдено {len(found_photos)} фотографий для имени {name}")  
-    for photo_key in found_photos:
-        photo_url = f"{API_GATEWAY_ORIGINAL}/?image={photo_key}"
-        print(f"Отправляем фото: {photo_url}")  
-        send_photo(chat_id, photo_url)
+    print(f"Найдено {len(found_photos)} фотографий для имени {name} на первой странице")  
+    send_found_photos(chat_id, name, found_photos, has_more, 0)
+
+def more_photos(chat_id):
+    session = load_session(chat_id)
+    cursor = session.get("find")
+    if not cursor:
+        send_message(chat_id, "Сначала выполните поиск командой /find {name}.")
+        return
+
+    found_photos, has_more = search_original_photos_by_name(cursor["name"], cursor["after"])
+    if not found_photos:
+        send_message(chat_id, "Больше фотографий нет.")
+        del session["find"]
+        store_session(chat_id, session)
+        return
+    send_found_photos(chat_id, cursor["name"], found_photos, has_more, cursor["shown"], session)
+
+def send_found_photos(chat_id, name, page, has_more, shown, session=None):
+    """
+    Отправляет страницу результатов поиска альбомами по 10 фотографий и запоминает
+    для команды /more последний отправленный оригинал: от него продолжается поиск.
+    """
+    chunks = [page[i:i + MEDIA_GROUP_SIZE] for i in range(0, len(page), MEDIA_GROUP_SIZE)]
+    sent = sum(telegram_executor.map(metrics.bind(lambda chunk: send_photo_group(chat_id, chunk)), chunks))
+    print(f"Отправлено альбомов: {sent} из {len(chunks)}")
+
+    session = session if session is not None else load_session(chat_id)
+    shown_now = shown + len(page)
+    if has_more:
+        session["find"] = {"name": name, "after": page[-1], "shown": shown_now}
+        save_session(chat_id, session)
+        send_message(
+            chat_id,
+            f"Показаны фотографии {shown + 1}-{shown_now}. "
+            f"Отправьте /more, чтобы получить следующие."
+        )
+    elif "find" in session:
+        del session["find"]
+        store_session(chat_id, session)
+
+def telegram_request(method, payload):
+    """
+    Вызывает метод Telegram Bot API через общую keep-alive сессию,
+    выдерживая паузу retry_after при ответе 429.
+    """
+    with metrics.span(f"telegram.{method}") as stage:
+        for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+            response = get_http_session().post(f"{TELEGRAM_API_URL}/{method}", json=payload, timeout=TELEGRAM_TIMEOUT)
+            stage.add(bytes_=len(response.content))
+            if response.status_code != 429 or attempt == TELEGRAM_MAX_RETRIES:
+                return response
+            retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+            print(f"Telegram ограничил частоту запросов, повтор через {retry_after} с")
+            time.sleep(retry_after)
+
+def photo_url(kind, key):
+    if kind == FACE_PHOTO:
+        return f"{API_GATEWAY}/?face={key}"
+    return f"{API_GATEWAY_ORIGINAL}/?image={key}"
+
+def file_id_key(kind, key):
+    return f"{FILE_ID_PREFIX}{kind}/{quote(key, safe='')}"
+
+def lookup_file_id(kind, key):
+    """
+    Возвращает file_id, полученный от Telegram при первой отправке фотографии.
+    """
+    if (kind, key) in file_ids:
+        return file_ids[(kind, key)]
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=file_id_key(kind, key))
+        file_id = response["Body"].read().decode("utf-8")
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        print(f"Ошибка чтения file_id для {key}: {e}")
+        return None
+    file_ids[(kind, key)] = file_id
+    return file_id
+
+def store_file_id(kind, key, message):
+    """
+    Запоминает file_id самого большого размера фотографии из отправленного сообщения.
+    """
+    try:
+        file_id = message["photo"][-1]["file_id"]
+        file_ids[(kind, key)] = file_id
+        get_s3_client().put_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=file_id_key(kind, key), Body=file_id.encode("utf-8"))
+    except Exception as e:
+        print(f"Ошибка сохранения file_id для {key}: {e}")
+
+def forget_file_id(kind, key):
+    file_ids.pop((kind, key), None)
+    try:
+        get_s3_client().delete_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=file_id_key(kind, key))
+    except Exception as e:
+        print(f"Ошибка удаления file_id для {key}: {e}")
+
+def send_stored_photo(chat_id, kind, key):
+    """
+    Отправляет фотографию по сохраненному file_id, а если его нет
+    или Telegram его отклонил - по ссылке через API Gateway.
+    """
+    file_id = lookup_file_id(kind, key)
+    if file_id:
+        response = send_photo(chat_id, file_id)
+        if response is None or not rejects_file_id(response):
+            return response is not None and response.ok
+        print(f"Telegram отклонил file_id для {key}, отправляем по ссылке")
+        forget_file_id(kind, key)
+
+    response = send_photo(chat_id, photo_url(kind, key))
+    if response is None or not response.ok:
+        return False
+    store_file_id(kind, key, response.json()["result"])
+    return True
+
+def rejects_file_id(response):
+    """
+    Проверяет, что Telegram отклонил запрос из-за идентификатора файла,
+    а не, например, из-за некорректного запроса.
+    """
+    if response.status_code != 400:
+        return False
+    try:
+        description = response.json().get("description", "")
+    except ValueError:
+        return False
+    return "file identifier" in description.lower()
+
+def send_photo_group(chat_id, photo_keys):
+    if len(photo_keys) == 1:
+        return send_stored_photo(chat_id, ORIGINAL_PHOTO, photo_keys[0])
+
+    known = list(storage_executor.map(metrics.bind(lambda key: lookup_file_id(ORIGINAL_PHOTO, key)), photo_keys))
+    try:
+        media = [file_id or photo_url(ORIGINAL_PHOTO, key) for key, file_id in zip(photo_keys, known)]
+        response = telegram_request("sendMediaGroup", media_group_payload(chat_id, media))
+        if any(known) and rejects_file_id(response):
+            # Ошибка "wrong file identifier/HTTP URL specified" одна и для file_id, и для ссылок:
+            # file_id забываем, только если тот же альбом прошел по ссылкам
+            print("Telegram отклонил идентификатор файла в альбоме, отправляем по ссылкам")
+            media = [photo_url(ORIGINAL_PHOTO, key) for key in photo_keys]
+            by_url = telegram_request("sendMediaGroup", media_group_payload(chat_id, media))
+            if by_url.ok:
+                for key, file_id in zip(photo_keys, known):
+                    if file_id:
+                        forget_file_id(ORIGINAL_PHOTO, key)
+                known = [None] * len(photo_keys)
+                response = by_url
+        print(f"Ответ отправки альбома: {response.status_code}")
+    except Exception as e:
+        print(f"Ошибка отправки альбома: {e}")
+        return False
+
+    if response.status_code == 400:
+        # Альбом отклоняется целиком из-за одной плохой фотографии, остальные отправляем по одной
+        print("Telegram отклонил альбом, отправляем фотографии по одной")
+        return any([send_stored_photo(chat_id, ORIGINAL_PHOTO, key) for key in photo_keys])
+    if not response.ok:
+        return False
+    for key, file_id, message in zip(photo_keys, known, response.json()["result"]):
+        if not file_id:
+            store_file_id(ORIGINAL_PHOTO, key, message)
+    return True
+
+def media_group_payload(chat_id, media):
+    return {"chat_id": chat_id, "media": [{"type": "photo", "media": item} for item in media]}
 
 def send_message(chat_id, text):
-    url = f"{TELEGRAM_API_URL}/sendMessage"
     payload = {"chat_id": chat_id, "text": text}
     try:
-        response = requests.post(url, json=payload)
+        response = telegram_request("sendMessage", payload)
         print(f"Ответ Telegram API: {response.status_code}, {response.text}") 
     except Exception as e:
         print(f"Ошибка отправки сообщения: {e}")
 
-def send_photo(chat_id, photo_url):
-    url = f"{TELEGRAM_API_URL}/sendPhoto"
-    payload = {"chat_id": chat_id, "photo": photo_url}
+def send_photo(chat_id, photo):
+    payload = {"chat_id": chat_id, "photo": photo}
     try:
-        response = requests.post(url, json=payload)
+        response = telegram_request("sendPhoto", payload)
         print(f"Ответ отправки фото: {response.status_code}") 
+        return response
     except Exception as e:
         print(f"Ошибка отправки фото: {e}")
+        return None
 
 def handle_text_input(chat_id, text):
-    if chat_id not in user_sessions or "metadata_key" not in user_sessions[chat_id]:
+    session = load_session(chat_id)
+    if "metadata_key" not in session:
         send_message(chat_id, "Ошибка.")
         return
 
-    metadata_key = user_sessions[chat_id]["metadata_key"]
-    update_face_name(metadata_key, text)
+    # Пока пользователь вводил имя, аренда могла истечь и достаться другому разметчику
+    etag = renew_lease(session["face_key"], chat_id)
+    if etag is None:
+        send_message(chat_id, "Время на это задание истекло. Получите новое фото командой /getface.")
+    else:
+        update_face_name(session["metadata_key"], text)
+        send_message(chat_id, f"Имя '{text}' сохранено для фотографии.")
+        release_lease(session["face_key"], chat_id, etag)
 
-    send_message(chat_id, f"Имя '{text}' сохранено для фотографии.")
-    del user_sessions[chat_id]
+    for key in ("face_key", "metadata_key", "face_url"):
+        session.pop(key, None)
+    store_session(chat_id, session)
 
 def sending_photo_error(message, chat_id):
     send_message(chat_id, "Отправка фотографий в данный момент не поддерживается.")
 
 def update_face_name(metadata_key, name):
-    response = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=metadata_key)
-    metadata = json.loads(response["Body"].read().decode("utf-8"))
-    print(f"Перед сохранением: {metadata}")  
-    metadata["name"] = name
-    store_metadata(metadata["face_key"], metadata)
-    print(f"Метаданные после обновления: {metadata}") 
-
-def store_metadata(face_key, metadata):
+    """
+    Сохраняет имя по ETag метаданных: crop_face может в это же время дописать
+    новый оригинал в original_photo_keys, и запись вслепую потеряла бы его.
+    """
+    from botocore.exceptions import ClientError
+    for attempt in range(NAME_UPDATE_ATTEMPTS):
+        response = get_s3_client().get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=metadata_key)
+        metadata = json.loads(response["Body"].read().decode("utf-8"))
+        print(f"Перед сохранением: {metadata}")
+        old_name = metadata.get("name")
+        metadata["name"] = name
+        try:
+            if store_metadata(metadata["face_key"], metadata, response["ETag"]):
+                update_name_index(metadata, old_name)
+            print(f"Метаданные после обновления: {metadata}")
+            return
+        except ClientError as e:
+            if not is_precondition_failed(e):
+                raise
+            print(f"Метаданные {metadata_key} изменились во время сохранения имени, перечитываем.")
+    raise RuntimeError(f"Не удалось сохранить имя для {metadata_key}")
+
+def store_metadata(face_key, metadata, etag=None):
     if "name" not in metadata or not metadata["name"]:
         print(f"Ошибка! Имя пустое для фотографии с ключом {face_key}")
+        return False
     else:
         metadata_key = face_key.replace(".jpg", ".json")
         metadata_body = json.dumps(metadata, indent=2)
-        s3_client.put_object(
+        condition = {"IfMatch": etag} if etag else {}
+        get_s3_client().put_object(
             Bucket=PROCESSED_FACES_BUCKET_NAME,
             Key=metadata_key,
             Body=metadata_body,
-            ContentType="application/json"
+            ContentType="application/json",
+            **condition
         )
         print(f"Метаданные успешно сохранены для фотографии с ключом {face_key}")
+        return True
 
-def search_original_photos_by_name(name):
+def original_exists(original_key):
+    s3_client = get_s3_client()
+    try:
+        s3_client.head_object(Bucket=IMAGES_BUCKET_NAME, Key=original_key)
+        return True
+    except s3_client.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+def name_originals(name, after=None):
+    """
+    Перебирает оригиналы .jpg с лицами name в порядке ключей индекса, начиная
+    после оригинала after. Для каждого возвращает ключ и его маркеры имени.
+    """
+    prefix = name_index_prefix(name)
+    # Маркеры оригинала имеют вид {ключ}/{face_key} с ASCII-символами после "/",
+    # поэтому "\uffff" идет после всех маркеров after и раньше следующего оригинала
+    start_after = f"{prefix}{quote(after, safe='')}/\uffff" if after else None
+    current, markers = None, []
+    for key in list_keys(PROCESSED_FACES_BUCKET_NAME, prefix, start_after):
+        original_key = unquote(key[len(prefix):].split("/", 1)[0])
+        if original_key != current:
+            if current is not None and current.endswith(".jpg"):
+                yield current, markers
+            current, markers = original_key, []
+        markers.append(key)
+    if current is not None and current.endswith(".jpg"):
+        yield current, markers
+
+def search_original_photos_by_name(name, after=None, limit=None):
+    """
+    Возвращает следующую страницу (до FIND_PAGE_SIZE) существующих оригиналов
+    с лицами name после оригинала after и признак, есть ли за ней еще.
+    """
     print(f"Поиск фотографий с именем: {name}")  
-    response = s3_client.list_objects_v2(Bucket=PROCESSED_FACES_BUCKET_NAME)
+    limit = limit or FIND_PAGE_SIZE
+    originals = name_originals(name, after)
     original_photos = []
-
-    for obj in response.get("Contents", []):
-        if obj["Key"].endswith(".json"):
-            metadata = s3_client.get_object(Bucket=PROCESSED_FACES_BUCKET_NAME, Key=obj["Key"])
-            metadata = json.loads(metadata["Body"].read().decode("utf-8"))
-            if metadata.get("name") == name:
-                response_ph = s3_client.list_objects_v2(Bucket=IMAGES_BUCKET_NAME)
-                for obj_ph in response_ph.get("Contents", []):
-                    if obj_ph["Key"].endswith(".jpg") and metadata["original_photo_key"] == obj_ph["Key"]:
-                        original_photos.append(metadata["original_photo_key"])
+    stale = []
+    # Существование проверяется только у оригиналов страницы: битая ссылка заставила бы
+    # Telegram отклонить весь альбом (это страхует и поштучная отправка в send_photo_group)
+    while len(original_photos) < limit:
+        batch = list(islice(originals, limit - len(original_photos)))
+        if not batch:
+            break
+        exists = storage_executor.map(metrics.bind(original_exists), [key for key, _ in batch])
+        for (original_key, markers), found in zip(batch, exists):
+            if found:
+                original_photos.append(original_key)
+            else:
+                stale.extend(markers)
+    if stale:
+        print(f"Оригиналы удалены, убираем маркеры имени: {stale}")
+        delete_keys(stale)
+    has_more = next(originals, None) is not None
 
     print(f"Найдено {len(original_photos)} фотографий.")  
     print(f"Найденные фото (ключи): {original_photos}")
-    return original_photos
+    return original_photos, has_more
 
+@metrics.instrument_handler("task2_bot")
 def handler(event, context):
     try:
         data = json.loads(event.get('body'))
@@ -169,15 +691,35 @@ def handler(event, context):
         text = message["text"]
 
         if text == "/start":
-            send_message(chat_id, "Команды:\n/getface - получить фото лица\n/find {name} - найти фото по имени")
+            send_message(chat_id, "Команды:\n/getface - получить фото лица\n/find {name} - найти фото по имени\n/more - следующие фото из поиска")
         elif text == "/getface":
             get_face(chat_id)
         elif text.startswith("/find"):
             find_photo(chat_id, text[6:].strip())
+        elif text == "/more":
+            more_photos(chat_id)
         else:
             handle_text_input(chat_id, text)
 
     elif "photo" in message:
         sending_photo_error(message, chat_id)
 
-    return {"statusCode": 200, "body": "OK"}
\ No newline at end of file
+    return {"statusCode": 200, "body": "OK"}
+
+
+def preload():
+    """
+    Импортирует boto3 и requests и создает клиенты при загрузке функции (режим eager).
+    """
+    get_s3_client()
+    get_http_session()
+
+if STARTUP_MODE == "eager":
+    preload()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["rebuild-index"]:
+        rebuild_index()
+    else:
+        print("Использование: python index.py rebuild-index")
@@ -1,26 +1,65 @@
-import cv2
-import boto3
+import hashlib
 import json
 import os
-from uuid import uuid4
-import numpy as np
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
-# Инициализация клиента S3
-s3_client = boto3.client(
-    "s3",
-    endpoint_url="https://storage.yandexcloud.net",
-    aws_access_key_id=os.getenv("YANDEX_STORAGE_ACCESS_KEY"),
-    aws_secret_access_key=os.getenv("YANDEX_STORAGE_SECRET_KEY"),
-)
+try:
+    import metrics
+except ImportError:
+    # Локальный запуск из репозитория: общий модуль лежит в каталоге common
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+    import metrics
+
+# lazy - boto3, cv2 и numpy импортируются, а клиент S3 создается при первом использовании;
+# eager - все загружается вместе с функцией
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = metrics.instrument_boto3(boto3.client(
+                    "s3",
+                    endpoint_url="https://storage.yandexcloud.net",
+                    aws_access_key_id=os.getenv("YANDEX_STORAGE_ACCESS_KEY"),
+                    aws_secret_access_key=os.getenv("YANDEX_STORAGE_SECRET_KEY"),
+                ))
+    return _s3_client
+
+
+# Индекс безымянных лиц для бота: пустой объект-маркер на каждое лицо
+UNNAMED_INDEX_PREFIX = "index/unnamed/"
+# Индекс имен в том же формате, что ведет бот: index/names/{имя}/{ключ оригинала}/{face_key}
+NAMES_INDEX_PREFIX = "index/names/"
+
+
+def name_index_key(name, original_key, face_key):
+    return f"{NAMES_INDEX_PREFIX}{quote(name, safe='')}/{quote(original_key, safe='')}/{face_key}"
 
 
 def save_metadata(bucket_name, face_key, metadata):
     """
-    Сохраняет метаданные лица в S3.
+    Добавляет лицо в индекс и сохраняет его метаданные в S3. Маркер индекса
+    пишется первым: по метаданным face_exists считает лицо готовым, и без
+    маркера оно уже никогда не попало бы к разметчикам. Возвращает успех записи.
     """
     metadata_key = face_key.replace(".jpg", ".json")
     metadata_body = json.dumps(metadata, indent=2)
     try:
+        s3_client = get_s3_client()
+        if metadata.get("name") is None:
+            s3_client.put_object(Bucket=bucket_name, Key=f"{UNNAMED_INDEX_PREFIX}{face_key}", Body=b"")
         s3_client.put_object(
             Bucket=bucket_name,
             Key=metadata_key,
@@ -28,28 +67,96 @@ def save_metadata(bucket_name, face_key, metadata):
             ContentType="application/json"
         )
         print(f"Метаданные успешно сохранены для ключа {metadata_key}.")
+        return True
     except Exception as e:
         print(f"Ошибка при сохранении метаданных: {e}")
+        return False
 
-def crop_face(image_bytes, face_rect):
+# Профили выходных изображений: наибольшая сторона (0 - без ограничения) и качество JPEG
+OUTPUT_PROFILES = {
+    "preview": {"max_side": 512, "quality": 85},
+    "archive": {"max_side": 0, "quality": 95},
+}
+OUTPUT_PROFILES.update(json.loads(os.getenv("CROP_PROFILE_SETTINGS", "{}")))
+# Включенные профили; первый сохраняется под ключом лица, остальные - под {профиль}/{ключ лица}
+CROP_PROFILES = os.getenv("CROP_PROFILES", "preview").split(",")
+# Поле вокруг лица: доля от размера лица, но не больше CROP_MAX_MARGIN пикселей
+CROP_MARGIN = float(os.getenv("CROP_MARGIN", "0.1"))
+CROP_MAX_MARGIN = int(os.getenv("CROP_MAX_MARGIN", "48"))
+
+# Коэффициенты уменьшения, которые OpenCV умеет применять прямо при декодировании JPEG,
+# и имена соответствующих флагов cv2
+REDUCED_DECODE_FLAGS = {
+    1: "IMREAD_COLOR",
+    2: "IMREAD_REDUCED_COLOR_2",
+    4: "IMREAD_REDUCED_COLOR_4",
+    8: "IMREAD_REDUCED_COLOR_8",
+}
+
+
+def choose_reduction(face_rects):
     """
-    Вырезает область лица из изображения.
+    Выбирает наибольшее уменьшение при декодировании, при котором каждое лицо
+    остается не меньше максимального размера всех включенных профилей.
     """
-    try:
+    target = [OUTPUT_PROFILES[profile]["max_side"] for profile in CROP_PROFILES]
+    if not face_rects or 0 in target:
+        return 1
+    smallest_face = min(max(rect["w"], rect["h"]) for rect in face_rects)
+    for reduction in (8, 4, 2):
+        if smallest_face / reduction >= max(target):
+            return reduction
+    return 1
+
+def decode_image(image_bytes, reduction=1):
+    """
+    Декодирует изображение из байтов, при необходимости сразу в уменьшенном размере.
+    """
+    import cv2
+    import numpy as np
+    with metrics.span("imdecode", bytes_=len(image_bytes)):
         np_image = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
+        image = cv2.imdecode(np_image, getattr(cv2, REDUCED_DECODE_FLAGS[reduction]))
+    if image is None:
+        print("Ошибка: Не удалось декодировать изображение.")
+    return image
 
-        if image is None:
-            print("Ошибка: Не удалось декодировать изображение.")
-            return None
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
+def crop_face(image, face_rect, reduction=1):
+    """
+    Вырезает область лица с полем из декодированного изображения
+    и кодирует ее во всех включенных профилях.
+    """
+    import cv2
+    try:
         x, y, w, h = face_rect["x"], face_rect["y"], face_rect["w"], face_rect["h"]
         print(f"Вырезание лица с координатами: x={x}, y={y}, ширина={w}, высота={h}")
 
-        face_image = image[y:y+h, x:x+w]
-        _, face_bytes = cv2.imencode('.jpg', face_image)
-        print(f"Размер вырезанного лица: {len(face_bytes.tobytes())} байт.")
-        return face_bytes.tobytes()
+        margin_x = min(int(w * CROP_MARGIN), CROP_MAX_MARGIN)
+        margin_y = min(int(h * CROP_MARGIN), CROP_MAX_MARGIN)
+        height, width = image.shape[:2]
+        left = max(0, (x - margin_x) // reduction)
+        top = max(0, (y - margin_y) // reduction)
+        right = min(width, -(-(x + w + margin_x) // reduction))
+        bottom = min(height, -(-(y + h + margin_y) // reduction))
+        face_image = image[top:bottom, left:right]
+
+        crops = {}
+        for profile in CROP_PROFILES:
+            settings = OUTPUT_PROFILES[profile]
+            output = face_image
+            longest = max(output.shape[:2])
+            if settings["max_side"] and longest > settings["max_side"]:
+                scale = settings["max_side"] / longest
+                output = cv2.resize(output, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            with metrics.span("imencode") as stage:
+                _, face_bytes = cv2.imencode('.jpg', output, [cv2.IMWRITE_JPEG_QUALITY, settings["quality"]])
+                crops[profile] = face_bytes.tobytes()
+                stage.add(bytes_=len(crops[profile]))
+            print(f"Размер вырезанного лица ({profile}): {len(crops[profile])} байт, пиковая память: {peak_rss_mb():.1f} МБ.")
+        return crops
     except Exception as e:
         print(f"Ошибка при вырезании лица: {e}")
         return None
@@ -63,45 +170,233 @@ def validate_face_coords(face_coords):
         return False
     return True
 
-def handler(event, context):
+# Лица одного оригинала загружаются в S3 параллельно
+CROP_UPLOAD_WORKERS = int(os.getenv("CROP_UPLOAD_WORKERS", "8"))
+# Сколько оригиналов держать декодированными одновременно: ограничивает пиковую память
+CROP_GROUP_WORKERS = int(os.getenv("CROP_GROUP_WORKERS", "1"))
+
+upload_executor = ThreadPoolExecutor(max_workers=CROP_UPLOAD_WORKERS)
+group_executor = ThreadPoolExecutor(max_workers=CROP_GROUP_WORKERS)
+
+
+def group_tasks(event):
     """
-    Обрабатывает событие, вырезает лицо из изображения и сохраняет его в S3.
+    Группирует задачи пачки по ключу оригинала, сохраняя порядок сообщений.
     """
+    groups = {}
     for record in event['messages']:
         try:
             task = json.loads(record['details']['message']['body'])
             original_key = task["original_photo_key"]
             face_rect = task["face_rectangle"]
+        except Exception as e:
+            print(f"Ошибка при разборе записи: {e}")
+            continue
+
+        if not validate_face_coords(face_rect):
+            continue
+        groups.setdefault(original_key, []).append(task)
+    return groups
+
+# Попытки дописать оригинал в метаданные, если их одновременно меняет бот
+LINK_ATTEMPTS = 3
+
+def face_key_for(etag, face_rect):
+    """
+    Строит ключ лица по ETag оригинала и прямоугольнику: повторная обработка
+    того же изображения дает те же ключи.
+    """
+    rect = f"{face_rect['x']},{face_rect['y']},{face_rect['w']},{face_rect['h']}"
+    return f"face_{hashlib.sha1(f'{etag}:{rect}'.encode()).hexdigest()}.jpg"
+
+def face_exists(face_key, original_key=None):
+    """
+    Проверяет, сохранено ли лицо: метаданные пишутся последними,
+    поэтому их наличие означает, что лицо обработано полностью.
+    С original_key заодно привязывает сохраненное лицо к этому оригиналу.
+    """
+    response = load_face_metadata(face_key)
+    if response is None:
+        return False
+    if original_key is not None:
+        link_original(face_key, response, original_key)
+    return True
 
-            if not validate_face_coords(face_rect):
-                continue
+def load_face_metadata(face_key):
+    from botocore.exceptions import ClientError
+    try:
+        return get_s3_client().get_object(Bucket=os.getenv("PROCESSED_FACES_BUCKET_NAME"), Key=face_key.replace(".jpg", ".json"))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
 
-            print(f"Загрузка изображения с ключом: {original_key}")
-            response = s3_client.get_object(Bucket=os.getenv("IMAGES_BUCKET_NAME"), Key=original_key)
-            image_bytes = response['Body'].read()
+def link_original(face_key, response, original_key):
+    """
+    Те же байты, загруженные под другим ключом, дают те же лица (ключ лица строится
+    по ETag). Новый оригинал дописывается в original_photo_keys, а если у лица
+    уже есть имя - добавляется и маркер имени, чтобы /find находил оба оригинала.
+    Метаданные перезаписываются по ETag, чтобы не затереть имя, сохраненное ботом.
+    """
+    from botocore.exceptions import ClientError
+    bucket_name = os.getenv("PROCESSED_FACES_BUCKET_NAME")
+    for attempt in range(LINK_ATTEMPTS):
+        metadata = json.loads(response["Body"].read())
+        keys = metadata.get("original_photo_keys") or [metadata["original_photo_key"]]
+        if original_key in keys:
+            return
+        if metadata.get("name"):
+            get_s3_client().put_object(Bucket=bucket_name, Key=name_index_key(metadata["name"], original_key, face_key), Body=b"")
+        metadata["original_photo_keys"] = keys + [original_key]
+        try:
+            get_s3_client().put_object(
+                Bucket=bucket_name,
+                Key=face_key.replace(".jpg", ".json"),
+                Body=json.dumps(metadata, indent=2),
+                ContentType="application/json",
+                IfMatch=response["ETag"]
+            )
+            print(f"Лицо {face_key} привязано к оригиналу {original_key}.")
+            return
+        except ClientError as e:
+            if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") != 412:
+                raise
+        # Метаданные изменились между чтением и записью - перечитываем
+        response = load_face_metadata(face_key)
+        if response is None:
+            return
+    raise RuntimeError(f"Не удалось привязать лицо {face_key} к оригиналу {original_key}")
 
-            face_bytes = crop_face(image_bytes, face_rect)
-            if face_bytes is None:
-                print("Ошибка: Не удалось вырезать лицо. Пропуск записи.")
-                continue
+def etag_of(response):
+    return response["ETag"].strip('"')
 
-            face_key = f"face_{uuid4().hex}.jpg"
-            print(f"Сохранение лица с ключом: {face_key}")
-            s3_client.put_object(
+def save_face(original_key, face_key, crops, uploaded_at=None):
+    """
+    Сохраняет вырезанное лицо во всех профилях и его метаданные в S3.
+    """
+    try:
+        print(f"Сохранение лица с ключом: {face_key}")
+        for i, profile in enumerate(CROP_PROFILES):
+            get_s3_client().put_object(
                 Bucket=os.getenv("PROCESSED_FACES_BUCKET_NAME"),
-                Key=face_key,
-                Body=face_bytes,
+                Key=face_key if i == 0 else f"{profile}/{face_key}",
+                Body=crops[profile],
                 ContentType="image/jpeg"
             )
 
-            metadata = {
-                "original_photo_key": original_key,
-                "face_key": face_key,
-                "name": None
-            }
-            save_metadata(os.getenv("PROCESSED_FACES_BUCKET_NAME"), face_key, metadata)
+        metadata = {
+            "original_photo_key": original_key,
+            "face_key": face_key,
+            "name": None
+        }
+        if not save_metadata(os.getenv("PROCESSED_FACES_BUCKET_NAME"), face_key, metadata):
+            return False
+        if uploaded_at is not None:
+            print(f"Задержка от загрузки оригинала до лица {face_key}: {time.time() - uploaded_at:.2f} с.")
+        return True
+    except Exception as e:
+        print(f"Ошибка при сохранении лица: {e}")
+        return False
 
-        except Exception as e:
-            print(f"Ошибка при обработке записи: {e}")
+def process_group(original_key, tasks):
+    """
+    Загружает и декодирует оригинал один раз и вырезает из него все лица,
+    которые еще не были сохранены. Возвращает счетчики обработки.
+    """
+    result = {"saved": 0, "skipped": 0, "downloads": 0, "decodes": 0}
+    response = None
+    etag = tasks[0].get("original_etag")
+    if not etag:
+        # Сообщения без ETag: узнаем его из самого оригинала
+        response = get_s3_client().get_object(Bucket=os.getenv("IMAGES_BUCKET_NAME"), Key=original_key)
+        result["downloads"] += 1
+        etag = etag_of(response)
+
+    face_keys = [face_key_for(etag, task["face_rectangle"]) for task in tasks]
+    exists = list(upload_executor.map(metrics.bind(lambda face_key: face_exists(face_key, original_key)), face_keys))
+    pending = [(task, face_key) for task, face_key, done in zip(tasks, face_keys, exists) if not done]
+    result["skipped"] = len(tasks) - len(pending)
+    if not pending:
+        print(f"Все лица изображения {original_key} уже сохранены, пропуск.")
+        if response is not None:
+            response['Body'].close()
+        return result
+
+    print(f"Загрузка изображения с ключом: {original_key}, лиц: {len(pending)}")
+    if response is None:
+        response = get_s3_client().get_object(Bucket=os.getenv("IMAGES_BUCKET_NAME"), Key=original_key)
+        result["downloads"] += 1
+    # Все лица группы вырезаются из одного декодирования, поэтому уменьшение
+    # выбирается по самому маленькому лицу
+    reduction = choose_reduction([task["face_rectangle"] for task, _ in pending])
+    image = decode_image(response['Body'].read(), reduction)
+    result["decodes"] += 1
+    if image is None:
+        return result
+    print(f"Оригинал {original_key} декодирован с уменьшением 1/{reduction}, пиковая память: {peak_rss_mb():.1f} МБ.")
+
+    uploads = []
+    for task, face_key in pending:
+        crops = crop_face(image, task["face_rectangle"], reduction)
+        if crops is None:
+            print("Ошибка: Не удалось вырезать лицо. Пропуск записи.")
+            continue
+        uploads.append(upload_executor.submit(metrics.bind(save_face), original_key, face_key, crops, task.get("uploaded_at")))
+    # Декодированный оригинал больше не нужен, пока идут загрузки
+    del image
+
+    result["saved"] = sum(upload.result() for upload in uploads)
+    print(json.dumps({
+        "original_photo_key": original_key,
+        "mode": "queue",
+        "faces": len(tasks),
+        "saved": result["saved"],
+        "skipped": result["skipped"],
+        "decodes": result["decodes"],
+    }))
+    return result
+
+def process_group_safely(original_key, tasks):
+    try:
+        return process_group(original_key, tasks)
+    except Exception as e:
+        print(f"Ошибка при обработке изображения {original_key}: {e}")
+        return {}
+
+@metrics.instrument_handler("crop_face")
+def handler(event, context):
+    """
+    Обрабатывает событие, вырезает лица из изображений и сохраняет их в S3.
+    """
+    groups = group_tasks(event)
+    faces = sum(len(tasks) for tasks in groups.values())
+    results = list(group_executor.map(metrics.bind(lambda group: process_group_safely(*group)), groups.items()))
+    downloads = sum(result.get("downloads", 0) for result in results)
+    decodes = sum(result.get("decodes", 0) for result in results)
+
+    stats = {
+        "records": len(event['messages']),
+        "faces": faces,
+        "saved": sum(result.get("saved", 0) for result in results),
+        "skipped_existing": sum(result.get("skipped", 0) for result in results),
+        "originals": len(groups),
+        "downloads": downloads,
+        "decodes": decodes,
+        "downloads_saved": faces - downloads,
+        "decodes_saved": faces - decodes,
+    }
+    print(f"Статистика обработки пачки: {json.dumps(stats)}")
+    for name in ("faces", "saved", "skipped_existing"):
+        metrics.count(name, stats[name])
+
+    return {"statusCode": 200}
+
+def preload():
+    """
+    Импортирует тяжелые модули и создает клиент S3 при загрузке функции (режим eager).
+    """
+    import cv2
+    get_s3_client()
 
-    return {"statusCode": 200}
\ No newline at end of file
+if STARTUP_MODE == "eager":
+    preload()
@@ -1,25 +1,65 @@
-import boto3
+from __future__ import annotations
+
+import hashlib
+import importlib.util
 import json
-import cv2
-import numpy as np
 import os
 import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+try:
+    import metrics
+except ImportError:
+    # Локальный запуск из репозитория: общий модуль лежит в каталоге common
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+    import metrics
+
+# lazy - boto3, cv2 и numpy импортируются, а клиенты создаются при первом использовании;
+# eager - все загружается вместе с функцией, как при прогреве экземпляра
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy")
+
+# Клиенты Yandex Cloud создаются при первом обращении и живут, пока жив экземпляр функции
+_s3_client = None
+_sqs_client = None
+_clients_lock = threading.Lock()
+
 
-# Инициализация клиентов Yandex Cloud
-s3_client = boto3.client(
-    "s3",
-    endpoint_url="https://storage.yandexcloud.net",
-    aws_access_key_id=os.getenv("YANDEX_ACCESS_KEY"),
-    aws_secret_access_key=os.getenv("YANDEX_SECRET_KEY"),
-)
-
-sqs_client = boto3.client(
-    "sqs",
-    endpoint_url="https://message-queue.api.cloud.yandex.net",
-    aws_access_key_id=os.getenv("YANDEX_ACCESS_KEY"),
-    aws_secret_access_key=os.getenv("YANDEX_SECRET_KEY"),
-    region_name="ru-central1",
-)
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        with _clients_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = metrics.instrument_boto3(boto3.client(
+                    "s3",
+                    endpoint_url="https://storage.yandexcloud.net",
+                    aws_access_key_id=os.getenv("YANDEX_ACCESS_KEY"),
+                    aws_secret_access_key=os.getenv("YANDEX_SECRET_KEY"),
+                ))
+    return _s3_client
+
+
+def get_sqs_client():
+    global _sqs_client
+    if _sqs_client is None:
+        with _clients_lock:
+            if _sqs_client is None:
+                import boto3
+                _sqs_client = metrics.instrument_boto3(boto3.client(
+                    "sqs",
+                    endpoint_url="https://message-queue.api.cloud.yandex.net",
+                    aws_access_key_id=os.getenv("YANDEX_ACCESS_KEY"),
+                    aws_secret_access_key=os.getenv("YANDEX_SECRET_KEY"),
+                    region_name="ru-central1",
+                ))
+    return _sqs_client
 
 queue_url = os.getenv("URL_QUEUE")
 
@@ -46,62 +86,444 @@ def extract_event_details(event: dict) -> list[dict]:
     return tasks
 
 
-def process_image(bucket: str, key: str) -> list[tuple[int, int, int, int]]:
-    """Загружает изображение и выполняет детекцию лиц."""
+# Параметры детектора лиц
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "haar")
+# Детекция выполняется на копии, уменьшенной до этого размера по длинной стороне
+DETECT_MAX_SIDE = int(os.getenv("DETECT_MAX_SIDE", "800"))
+# Минимальный размер лица в пикселях исходного изображения
+FACE_MIN_SIZE = int(os.getenv("FACE_MIN_SIZE", "30"))
+# По умолчанию - каскад из поставки OpenCV, путь к нему известен только после импорта cv2
+HAAR_CASCADE_PATH = os.getenv("HAAR_CASCADE_PATH")
+HAAR_SCALE_FACTOR = float(os.getenv("HAAR_SCALE_FACTOR", "1.2"))
+HAAR_MIN_NEIGHBORS = int(os.getenv("HAAR_MIN_NEIGHBORS", "6"))
+DNN_MODEL_PATH = os.getenv("DNN_MODEL_PATH", "res10_300x300_ssd_iter_140000.caffemodel")
+DNN_CONFIG_PATH = os.getenv("DNN_CONFIG_PATH", "deploy.prototxt")
+DNN_INPUT_SIZE = int(os.getenv("DNN_INPUT_SIZE", "300"))
+DNN_CONFIDENCE = float(os.getenv("DNN_CONFIDENCE", "0.6"))
+
+
+class HaarFaceDetector:
+    """Каскад Хаара из поставки OpenCV."""
+
+    def __init__(self):
+        import cv2
+        path = HAAR_CASCADE_PATH or cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise RuntimeError(f"Не удалось загрузить каскад {path}")
+
+    def detect(self, img: np.ndarray, scale: float) -> list[tuple[int, int, int, int]]:
+        import cv2
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        min_size = max(1, round(FACE_MIN_SIZE * scale))
+        faces = self.cascade.detectMultiScale(
+            gray, scaleFactor=HAAR_SCALE_FACTOR, minNeighbors=HAAR_MIN_NEIGHBORS, minSize=(min_size, min_size)
+        )
+        return [tuple(face) for face in faces]
+
+
+class DnnFaceDetector:
+    """SSD-модель лиц для cv2.dnn (например, res10_300x300 из OpenCV)."""
+
+    def __init__(self):
+        import cv2
+        self.net = cv2.dnn.readNet(DNN_MODEL_PATH, DNN_CONFIG_PATH)
+
+    def detect(self, img: np.ndarray, scale: float) -> list[tuple[int, int, int, int]]:
+        import cv2
+        height, width = img.shape[:2]
+        blob = cv2.dnn.blobFromImage(img, 1.0, (DNN_INPUT_SIZE, DNN_INPUT_SIZE), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()
+
+        faces = []
+        for detection in detections[0, 0]:
+            if detection[2] < DNN_CONFIDENCE:
+                continue
+            x1, y1, x2, y2 = (detection[3:7] * [width, height, width, height]).astype(int)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 - x1 >= FACE_MIN_SIZE * scale and y2 - y1 >= FACE_MIN_SIZE * scale:
+                faces.append((x1, y1, x2 - x1, y2 - y1))
+        return faces
+
+
+DETECTOR_BACKENDS = {
+    "haar": HaarFaceDetector,
+    "dnn": DnnFaceDetector,
+}
+
+# Модель загружается один раз на поток обработки и переиспользуется между вызовами:
+# экземпляры детекторов OpenCV не рассчитаны на вызовы из нескольких потоков
+_detectors = threading.local()
+
+
+def get_detector():
+    """Возвращает детектор выбранного бэкенда, загружая модель при первом обращении."""
+    detector = getattr(_detectors, "detector", None)
+    if detector is None:
+        detector = DETECTOR_BACKENDS[DETECTOR_BACKEND]()
+        _detectors.detector = detector
+        print(f"Загружен детектор лиц: {DETECTOR_BACKEND}.")
+    return detector
+
+
+def detect_faces(img: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """Ищет лица на уменьшенной копии изображения и возвращает координаты в исходном масштабе."""
+    import cv2
+    height, width = img.shape[:2]
+    scale = min(1.0, DETECT_MAX_SIDE / max(height, width))
+    if scale < 1.0:
+        work = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        work = img
+
+    with metrics.span("detect") as stage:
+        found = get_detector().detect(work, scale)
+        stage.add(items=len(found))
+
+    faces = []
+    for x, y, w, h in found:
+        x, y = int(x / scale), int(y / scale)
+        w, h = min(int(round(w / scale)), width - x), min(int(round(h / scale)), height - y)
+        faces.append((x, y, w, h))
+    return faces
+
+
+# Слитный режим: лица вырезаются и сохраняются прямо здесь, без передачи через очередь
+FUSED_MODE = os.getenv("FUSED_MODE", "0") == "1"
+# Изображения с большим числом лиц уходят в очередь, чтобы не упереться в таймаут
+FUSED_MAX_FACES = int(os.getenv("FUSED_MAX_FACES", "10"))
+# execution_timeout функции в секундах
+FUNCTION_TIMEOUT = float(os.getenv("FUNCTION_TIMEOUT", "5"))
+# Запас до конца вызова: потоки ждут загрузки уже вырезанных лиц (не дольше половины запаса),
+# затем обработчик отправляет задачи в очередь и записывает результаты детекции
+FUSED_TAIL_RESERVE = float(os.getenv("FUSED_TAIL_RESERVE", "2"))
+# Секунды от начала вызова, после которых новые лица не вырезаются, а уходят в очередь.
+# Срок общий для всех потоков пачки, поэтому считается от таймаута функции, а не от времени одного изображения
+FUSED_TIME_BUDGET = float(os.getenv("FUSED_TIME_BUDGET") or max(0.0, FUNCTION_TIMEOUT - FUSED_TAIL_RESERVE))
+
+_crop_face_module = None
+
+
+def get_crop_face_module():
+    """Возвращает модуль функции crop_face, который собирается в архив как crop_face.py."""
+    global _crop_face_module
+    if _crop_face_module is None:
+        try:
+            import crop_face as module
+        except ImportError:
+            # Локальный запуск из репозитория: модуль лежит в каталоге соседней функции
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "crop_face", "index.py")
+            spec = importlib.util.spec_from_file_location("crop_face", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        _crop_face_module = module
+    return _crop_face_module
+
+
+def crop_faces_fused(key: str, img: np.ndarray, messages: list[dict], uploaded_at: float, deadline: float) -> list[dict]:
+    """Вырезает и сохраняет лица из уже декодированного изображения. Возвращает задачи, оставшиеся для очереди."""
+    if len(messages) > FUSED_MAX_FACES:
+        print(f"На изображении {key} слишком много лиц для слитного режима, отправляем в очередь.")
+        return messages
+
+    crop_face = get_crop_face_module()
+    remaining = []
+    uploads = []
+    for i, message in enumerate(messages):
+        if time.monotonic() > deadline:
+            print(f"Исчерпан бюджет времени, {len(messages) - i} лиц отправляются в очередь.")
+            remaining.extend(messages[i:])
+            break
+        face_key = crop_face.face_key_for(message["original_etag"], message["face_rectangle"])
+        try:
+            if crop_face.face_exists(face_key, key):
+                continue
+            crops = crop_face.crop_face(img, message["face_rectangle"])
+        except Exception as e:
+            # Ошибка одного лица (например, 403 или 5xx от хранилища) не должна терять остальные
+            print(f"Ошибка слитной обработки лица {face_key}: {e}, отправляем в очередь.")
+            remaining.append(message)
+            continue
+        if crops is None:
+            remaining.append(message)
+            continue
+        uploads.append((message, crop_face.upload_executor.submit(metrics.bind(crop_face.save_face), key, face_key, crops, uploaded_at)))
+
+    # Лица, которые не удалось сохранить или сохранить вовремя, дорабатывает crop_face через очередь;
+    # если загрузка все же завершится, crop_face увидит лицо через face_exists и пропустит его
+    upload_deadline = deadline + FUSED_TAIL_RESERVE / 2
+    for message, upload in uploads:
+        try:
+            saved = upload.result(timeout=max(0.0, upload_deadline - time.monotonic()))
+        except FutureTimeoutError:
+            print(f"Лицо с изображения {key} не сохранено вовремя, отправляем в очередь.")
+            saved = False
+        if not saved:
+            remaining.append(message)
+
+    print(json.dumps({
+        "original_photo_key": key,
+        "mode": "fused",
+        "faces": len(messages),
+        "fused": len(messages) - len(remaining),
+        "queued": len(remaining),
+        "decodes": 1,
+    }))
+    return remaining
+
+
+def detector_signature() -> str:
+    """Хэш параметров детектора: при их изменении изображения детектируются заново."""
+    params = {"backend": DETECTOR_BACKEND, "max_side": DETECT_MAX_SIDE, "min_size": FACE_MIN_SIZE}
+    if DETECTOR_BACKEND == "haar":
+        params.update(cascade=HAAR_CASCADE_PATH, scale_factor=HAAR_SCALE_FACTOR, min_neighbors=HAAR_MIN_NEIGHBORS)
+    else:
+        params.update(model=DNN_MODEL_PATH, config=DNN_CONFIG_PATH, input_size=DNN_INPUT_SIZE, confidence=DNN_CONFIDENCE)
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+# Результаты детекции по содержимому изображения (ETag): повторно загруженное
+# изображение или повторная доставка события не запускают детекцию заново
+DETECTIONS_PREFIX = f"index/detections/{DETECTOR_BACKEND}-{detector_signature()}/"
+# Сколько последних результатов держать в памяти экземпляра (128 МБ на всю функцию)
+DETECTIONS_CACHE_SIZE = int(os.getenv("DETECTIONS_CACHE_SIZE", "1024"))
+
+_detections = OrderedDict()
+_detections_lock = threading.Lock()
+
+
+def cached_detection(etag: str) -> dict | None:
+    with _detections_lock:
+        record = _detections.get(etag)
+        if record is not None:
+            _detections.move_to_end(etag)
+        return record
+
+
+def remember_detection(etag: str, record: dict) -> None:
+    with _detections_lock:
+        _detections[etag] = record
+        _detections.move_to_end(etag)
+        while len(_detections) > DETECTIONS_CACHE_SIZE:
+            _detections.popitem(last=False)
+
+
+def load_detection(etag: str) -> dict | None:
+    """Возвращает сохраненный результат детекции для изображения с данным ETag."""
+    record = cached_detection(etag)
+    if record is not None:
+        return record
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=os.getenv("PROCESSED_FACES_BUCKET_NAME"), Key=f"{DETECTIONS_PREFIX}{etag}.json")
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        print(f"Ошибка чтения результата детекции {etag}: {e}")
+        return None
+    record = json.loads(response["Body"].read())
+    remember_detection(etag, record)
+    return record
+
+
+def save_detection(etag: str, faces: list, done: bool, keys: list[str]) -> None:
+    """
+    Сохраняет результат детекции. done означает, что все лица уже сохранены или переданы в очередь;
+    keys - ключи оригиналов, под которыми встречалось изображение.
+    """
+    record = {"faces": [list(face) for face in faces], "done": done, "keys": keys}
+    remember_detection(etag, record)
+    try:
+        get_s3_client().put_object(
+            Bucket=os.getenv("PROCESSED_FACES_BUCKET_NAME"),
+            Key=f"{DETECTIONS_PREFIX}{etag}.json",
+            Body=json.dumps(record, default=to_builtin),
+            ContentType="application/json",
+        )
+    except Exception as e:
+        print(f"Ошибка сохранения результата детекции {etag}: {e}")
+
+
+def face_messages(key: str, etag: str, faces: list, uploaded_at: float) -> list[dict]:
+    return [
+        {
+            "original_photo_key": key,
+            "original_etag": etag,
+            "face_rectangle": {"x": x, "y": y, "w": w, "h": h},
+            "uploaded_at": uploaded_at,
+        }
+        for x, y, w, h in faces
+    ]
+
+
+def link_known_faces(key: str, messages: list[dict]) -> list[dict]:
+    """
+    Привязывает уже сохраненные лица изображения к новому ключу оригинала.
+    Возвращает задачи для лиц, которых еще нет: их сохранит и привяжет crop_face.
+    """
+    crop_face = get_crop_face_module()
+    missing = []
+    for message in messages:
+        face_key = crop_face.face_key_for(message["original_etag"], message["face_rectangle"])
+        try:
+            if crop_face.face_exists(face_key, key):
+                continue
+        except Exception as e:
+            print(f"Ошибка привязки лица {face_key} к оригиналу {key}: {e}, отправляем в очередь.")
+        missing.append(message)
+    return missing
+
+
+def process_image(bucket: str, key: str, deadline: float) -> dict | None:
+    """Загружает изображение, выполняет детекцию лиц и возвращает задачи для очереди."""
     print(f"Начинаем загрузку изображения {key} из бакета {bucket}.")
     
     try:
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        image_data = response["Body"].read()
-        print(f"Изображение {key} успешно загружено. Начинаем обработку.")
-        
-        # Преобразование изображения
-        np_img = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Загрузка каскада для распознавания лиц
-        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-        
-        # Обнаружение лиц
-        faces = cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=6, minSize=(30, 30))
+        response = get_s3_client().get_object(Bucket=bucket, Key=key)
+        uploaded_at = response["LastModified"].timestamp()
+        etag = response["ETag"].strip('"')
+
+        record = load_detection(etag)
+        keys = record.get("keys", []) if record is not None else []
+        if key not in keys:
+            keys = keys + [key]
+        if record is not None and record["done"]:
+            response["Body"].close()
+            if key in record.get("keys", []):
+                print(f"Изображение {key} с ETag {etag} уже обработано, пропуск.")
+                return None
+            # Те же байты под новым ключом: лица уже есть, их нужно только привязать к этому оригиналу
+            print(f"Изображение {key} с ETag {etag} уже обработано под другим ключом, привязываем лица.")
+            faces = [tuple(face) for face in record["faces"]]
+            messages = link_known_faces(key, face_messages(key, etag, faces, uploaded_at))
+            if not messages:
+                save_detection(etag, faces, True, keys)
+            return {"etag": etag, "faces": faces, "messages": messages, "keys": keys}
+
+        img = None
+        if record is None or FUSED_MODE:
+            image_data = response["Body"].read()
+            print(f"Изображение {key} успешно загружено. Начинаем обработку.")
+
+            # Преобразование изображения
+            import cv2
+            import numpy as np
+            with metrics.span("imdecode", bytes_=len(image_data)):
+                np_img = np.frombuffer(image_data, np.uint8)
+                img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+        else:
+            response["Body"].close()
+
+        if record is None:
+            # Обнаружение лиц
+            faces = detect_faces(img)
+            save_detection(etag, faces, not faces, keys)
+        else:
+            faces = [tuple(face) for face in record["faces"]]
         print(f"На изображении {key} найдено {len(faces)} лиц.")
         
-        return faces
+        messages = face_messages(key, etag, faces, uploaded_at)
+        if FUSED_MODE and messages:
+            messages = crop_faces_fused(key, img, messages, uploaded_at, deadline)
+        else:
+            print(json.dumps({"original_photo_key": key, "mode": "queue", "faces": len(messages), "decodes": int(img is not None)}))
+        return {"etag": etag, "faces": faces, "messages": messages, "keys": keys}
 
     except Exception as e:
         print(f"Ошибка при обработке изображения {key}: {e}")
-        return []
+        return None
 
 
-def send_task_to_queue(task: dict) -> None:
-    """Отправляет задачу в очередь."""
-    try:
-        # Преобразуем все int32 в int, чтобы избежать ошибки сериализации
-        task = json.loads(json.dumps(task, default=lambda x: int(x) if isinstance(x, np.integer) else x))
-        
-        response = sqs_client.send_message(QueueUrl=queue_url, MessageBody=json.dumps(task))
-        print(f"Задача успешно отправлена в очередь. ID сообщения: {response['MessageId']}")
-    except Exception as e:
-        print(f"Ошибка при отправке задачи в очередь: {e}")
+# Загрузка из S3 и работа cv2 отпускают GIL, поэтому изображения пачки обрабатываются параллельно.
+# Число потоков ограничено памятью функции: каждый держит декодированное изображение.
+DETECT_WORKERS = int(os.getenv("DETECT_WORKERS", "2"))
+SQS_BATCH_SIZE = 10
+SQS_MAX_RETRIES = int(os.getenv("SQS_MAX_RETRIES", "3"))
+
+executor = ThreadPoolExecutor(max_workers=DETECT_WORKERS)
+
+
+def to_builtin(value):
+    """Приводит числа numpy к встроенным типам для json.dumps."""
+    import numpy as np
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
 
 
+def send_tasks_to_queue(tasks: list[dict]) -> list[dict]:
+    """Отправляет задачи в очередь пачками до 10 сообщений, повторяя неудавшиеся. Возвращает неотправленные задачи."""
+    unsent = []
+    for start in range(0, len(tasks), SQS_BATCH_SIZE):
+        entries = [
+            {"Id": str(i), "MessageBody": json.dumps(task, default=to_builtin)}
+            for i, task in enumerate(tasks[start:start + SQS_BATCH_SIZE])
+        ]
+
+        for attempt in range(SQS_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(min(2.0, 0.1 * 2 ** attempt))
+            try:
+                response = get_sqs_client().send_message_batch(QueueUrl=queue_url, Entries=entries)
+            except Exception as e:
+                print(f"Ошибка при отправке пачки задач в очередь: {e}")
+                continue
+
+            print(f"Отправлено в очередь задач: {len(response.get('Successful', []))}.")
+            failed = response.get("Failed", [])
+            for failure in failed:
+                print(f"Ошибка при отправке задачи {failure['Id']}: {failure.get('Code')} {failure.get('Message')}")
+            # Ошибки отправителя (некорректное сообщение) повторять бесполезно
+            retry_ids = {failure["Id"] for failure in failed if not failure.get("SenderFault")}
+            unsent.extend(tasks[start + int(failure["Id"])] for failure in failed if failure.get("SenderFault"))
+            entries = [entry for entry in entries if entry["Id"] in retry_ids]
+            if not entries:
+                break
+        else:
+            print(f"Не удалось отправить задач в очередь: {len(entries)}.")
+            unsent.extend(tasks[start + int(entry["Id"])] for entry in entries)
+    return unsent
+
+
+@metrics.instrument_handler("detect_face")
 def handler(event: dict, context) -> dict:
     """Обработчик событий."""
     print("Запуск обработчика событий.")
 
+    deadline = time.monotonic() + FUSED_TIME_BUDGET
     tasks = extract_event_details(event)
+    metrics.count("images", len(tasks))
+    results = executor.map(metrics.bind(lambda task: process_image(task["bucket"], task["key"], deadline)), tasks)
 
-    for task in tasks:
-        faces = process_image(task["bucket"], task["key"])
-        
-        for x, y, w, h in faces:
-            message = {
-                "original_photo_key": task["key"],
-                "face_rectangle": {"x": x, "y": y, "w": w, "h": h},
-            }
+    results = [result for result in results if result is not None]
+    messages = []
+    for result in results:
+        for message in result["messages"]:
             print(f"Готовим задачу для отправки в очередь: {message}")
-            send_task_to_queue(message)
+            messages.append(message)
+
+    metrics.count("faces_queued", len(messages))
+    unsent = {message["original_etag"] for message in send_tasks_to_queue(messages)}
+
+    # Изображение считается обработанным, когда все его лица сохранены или переданы в очередь
+    for result in results:
+        if result["faces"] and result["etag"] not in unsent:
+            save_detection(result["etag"], result["faces"], True, result["keys"])
 
     print("Обработка события завершена.")
     return {"statusCode": 200}
+
+
+def preload() -> None:
+    """Импортирует тяжелые модули и создает клиенты при загрузке функции (режим eager)."""
+    import cv2
+    get_s3_client()
+    get_sqs_client()
+    if FUSED_MODE:
+        get_crop_face_module()
+
+
+if STARTUP_MODE == "eager":
+    preload()
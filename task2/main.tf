@@ -29,6 +29,28 @@ resource "yandex_storage_bucket" "processed_faces" {
   access_key = yandex_iam_service_account_static_access_key.sa_key.access_key
   secret_key = yandex_iam_service_account_static_access_key.sa_key.secret_key
   acl        = "private"
+
+  # Брошенные аренды лиц; живая аренда все равно действует не дольше LEASE_TTL
+  lifecycle_rule {
+    id      = "leases"
+    enabled = true
+    prefix  = "index/leases/"
+
+    expiration {
+      days = 1
+    }
+  }
+
+  # Сессии пользователей: незавершенное задание и позиция в результатах /find
+  lifecycle_rule {
+    id      = "sessions"
+    enabled = true
+    prefix  = "index/sessions/"
+
+    expiration {
+      days = 7
+    }
+  }
 }
 
 resource "yandex_message_queue" "processing_queue" {
@@ -110,6 +132,7 @@ resource "yandex_function" "tg_bot_func" {
     API_GATEWAY_ORIGINAL        = yandex_api_gateway.api_gateway_original.domain
     IMAGES_BUCKET_NAME          = var.images_bucket_name
     PROCESSED_FACES_BUCKET_NAME = var.processed_faces_bucket_name
+    METRICS_SAMPLE_RATE         = var.metrics_sample_rate
   }
   content {
     zip_filename = archive_file.zip1.output_path
@@ -117,18 +140,30 @@ resource "yandex_function" "tg_bot_func" {
   depends_on = [yandex_api_gateway.api_gateway, yandex_api_gateway.api_gateway_original]
 }
 
+locals {
+  # detect_face рассчитывает бюджет слитного режима от этого же таймаута
+  detect_face_timeout = 5
+}
+
 resource "yandex_function" "detect_face_func" {
   name               = var.detect_face_func_name
   user_hash          = "v2"
   runtime            = "python312"
   entrypoint         = "index.handler"
   memory             = "128"
-  execution_timeout  = "5"
+  execution_timeout  = local.detect_face_timeout
   service_account_id = var.service_account_id
   environment = {
-    YANDEX_ACCESS_KEY = yandex_iam_service_account_static_access_key.sa_key.access_key
-    YANDEX_SECRET_KEY = yandex_iam_service_account_static_access_key.sa_key.secret_key
-    URL_QUEUE         = yandex_message_queue.processing_queue.id
+    YANDEX_ACCESS_KEY           = yandex_iam_service_account_static_access_key.sa_key.access_key
+    YANDEX_SECRET_KEY           = yandex_iam_service_account_static_access_key.sa_key.secret_key
+    URL_QUEUE                   = yandex_message_queue.processing_queue.id
+    FUSED_MODE                  = var.fused_mode
+    FUNCTION_TIMEOUT            = local.detect_face_timeout
+    YANDEX_STORAGE_ACCESS_KEY   = yandex_iam_service_account_static_access_key.sa_key.access_key
+    YANDEX_STORAGE_SECRET_KEY   = yandex_iam_service_account_static_access_key.sa_key.secret_key
+    IMAGES_BUCKET_NAME          = var.images_bucket_name
+    PROCESSED_FACES_BUCKET_NAME = var.processed_faces_bucket_name
+    METRICS_SAMPLE_RATE         = var.metrics_sample_rate
   }
   content {
     zip_filename = archive_file.zip3.output_path
@@ -148,6 +183,7 @@ resource "yandex_function" "crop_face_func" {
     YANDEX_STORAGE_SECRET_KEY   = yandex_iam_service_account_static_access_key.sa_key.secret_key
     IMAGES_BUCKET_NAME          = var.images_bucket_name
     PROCESSED_FACES_BUCKET_NAME = var.processed_faces_bucket_name
+    METRICS_SAMPLE_RATE         = var.metrics_sample_rate
   }
   content {
     zip_filename = archive_file.zip2.output_path
@@ -209,17 +245,66 @@ EOT
 resource "archive_file" "zip1" {
   type        = "zip"
   output_path = "bot.zip"
-  source_dir  = "bot"
+
+  source {
+    content  = file("bot/index.py")
+    filename = "index.py"
+  }
+
+  source {
+    content  = file("bot/requirements.txt")
+    filename = "requirements.txt"
+  }
+
+  # Общий модуль замеров task1 и task2
+  source {
+    content  = file("../common/metrics.py")
+    filename = "metrics.py"
+  }
 }
 
 resource "archive_file" "zip2" {
   type        = "zip"
   output_path = "crop-face.zip"
-  source_dir  = "crop_face"
+
+  source {
+    content  = file("crop_face/index.py")
+    filename = "index.py"
+  }
+
+  source {
+    content  = file("crop_face/requirements.txt")
+    filename = "requirements.txt"
+  }
+
+  source {
+    content  = file("../common/metrics.py")
+    filename = "metrics.py"
+  }
 }
 
 resource "archive_file" "zip3" {
   type        = "zip"
   output_path = "detect-face.zip"
-  source_dir  = "detect_face"
+
+  source {
+    content  = file("detect_face/index.py")
+    filename = "index.py"
+  }
+
+  source {
+    content  = file("detect_face/requirements.txt")
+    filename = "requirements.txt"
+  }
+
+  # Слитный режим переиспользует код функции crop_face
+  source {
+    content  = file("crop_face/index.py")
+    filename = "crop_face.py"
+  }
+
+  source {
+    content  = file("../common/metrics.py")
+    filename = "metrics.py"
+  }
 }
\ No newline at end of file
@@ -63,3 +63,12 @@ variable "service_account_id" {
   type = string
 }
 
+variable "fused_mode" {
+  type    = string
+  default = "0"
+}
+
+variable "metrics_sample_rate" {
+  type    = string
+  default = "1"
+}